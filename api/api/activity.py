@@ -0,0 +1,53 @@
+import datetime
+from collections import defaultdict
+
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+
+from . import models
+from .db import add_counts
+
+# The periods that a player's activity can be added up over. Weeks start on Monday.
+GRANULARITIES = ('day', 'week', 'month')
+
+
+def count_sessions(sessions):
+    """
+    Returns the playtime and number of sessions of each player on each day, keyed by (player id, date), given a list of
+    (player id, session).
+    """
+    counts = defaultdict(lambda: {'playtime': datetime.timedelta(), 'session_count': 0})
+    for player_id, session in sessions:
+        count = counts[(player_id, session.started_at.astimezone(timezone.utc).date())]
+        count['playtime'] += session.duration
+        count['session_count'] += 1
+    return counts
+
+
+def add_activity(counts):
+    """
+    Adds `counts` (see `count_sessions`) onto the players' stored activity, creating the days that don't exist yet.
+
+    Callers must make sure nobody else is adding to the same players' activity in the meantime (see `advisory_lock`).
+    """
+    add_counts(models.PlayerActivity, ('player_id', 'date'), counts)
+
+
+def get_activity(player_id, granularity='day', started_after=None, started_before=None):
+    """
+    Returns the playtime and number of sessions of a player in each day, week or month that they played in, between
+    the (inclusive) dates, as a list of (first day of the period, playtime, session count).
+    """
+    days = models.PlayerActivity.objects.filter(player_id=player_id)
+    if started_after is not None:
+        days = days.filter(date__gte=started_after)
+    if started_before is not None:
+        days = days.filter(date__lte=started_before)
+    if granularity == 'day':
+        return list(days.order_by('date').values_list('date', 'playtime', 'session_count'))
+    period = TruncWeek('date') if granularity == 'week' else TruncMonth('date')
+    return list(days.annotate(period=period).values_list('period').annotate(
+        playtime=Sum('playtime'),
+        session_count=Sum('session_count')
+    ).order_by('period'))
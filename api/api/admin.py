@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.db import models
 from .models import Patron, Player, Announcement, Report, TextMessage, Event, Log
+from .search import search_text_messages
 from django_admin_listfilter_dropdown.filters import DropdownFilter
 from admin_auto_filters.filters import AutocompleteFilter
 from prettyjson import PrettyJSONWidget
@@ -12,7 +13,7 @@ class PatronAdmin(admin.ModelAdmin):
 
 
 class PlayerAdmin(admin.ModelAdmin):
-    search_fields = ('id', 'names__name', 'ips')
+    search_fields = ('=id', '^name')
     exclude = ('names', 'sessions')
     list_display = ['id', 'name', 'playtime', 'ips']
     list_filter = []
@@ -66,6 +67,12 @@ class TextMessageAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         return False
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        # Go through the full-text index rather than scanning every message. Moderators tend to type partial words.
+        return search_text_messages(queryset, search_term, 'prefix'), False
+
 
 class EventAdmin(admin.ModelAdmin):
     list_display = ('type', 'data')
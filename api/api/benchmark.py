@@ -0,0 +1,257 @@
+import datetime
+import json
+import random
+import tempfile
+from json.decoder import JSONDecodeError
+
+from django.db import transaction
+from django.urls import URLPattern
+
+from . import ingest, models
+from .exceptions import DuplicateLogException
+from .logreader import LogReader, log_crc
+from .timing import NULL_TIMER
+from ..urls import router, urlpatterns
+
+DAMAGE_TYPES = ['DH_M1GarandDamType', 'DH_MP40DamType', 'DH_Kar98DamType', 'DH_ThompsonDamType', 'DH_StenDamType',
+                'DH_M1CarbineDamType', 'DH_MG42DamType', 'DH_30CalDamType', 'DH_StielGranateDamType',
+                'DH_M1GrenadeDamType', 'DH_PanzerschreckDamType', 'DH_BazookaDamType']
+INFANTRY_PAWNS = ['DH_GermanPawn', 'DH_AmericanPawn', 'DH_BritishPawn', 'DH_SovietPawn']
+VEHICLES = ['DH_PantherDTank', 'DH_ShermanTank', 'DH_StuH42Destroyer', 'DH_M10Destroyer', 'DH_OpelBlitzTransport',
+            'DH_GMCTruck']
+CONSTRUCTIONS = ['DH_Construction_Sandbags', 'DH_Construction_Hedgehog', 'DH_Construction_PlatoonHQ',
+                 'DH_Construction_Resupply_Players', 'DH_Construction_ATGun_Pak40']
+WORDS = ['push', 'the', 'bridge', 'gg', 'need', 'ammo', 'tank', 'left', 'right', 'smoke', 'arty', 'on', 'me', 'rally',
+         'squad', 'lead', 'mg', 'church', 'cap', 'defend', 'attack', 'nice', 'shot', 'lol', 'ty', 'np', 'medic']
+MAPS = ['DH-Carentan', 'DH-Foy', 'DH-Kommerscheidt', 'DH-Stoumont', 'DH-Hill_400', 'DH-Bois_Jacques']
+ADMIN_PLAYER_ID = '20b300195d48c2ccc2651885cfea1a2f'
+FIRST_PLAYER_ID = 76561197960265728
+
+
+class Rollback(Exception):
+    pass
+
+
+def generate_log(players=64, rounds=3, frags=500, vehicle_frags=10, rally_points=20, constructions=30, events=5,
+                 text_messages=200, version='v9.1.0', seed=0, player_pool=None, started_at=None):
+    """
+    Returns a made up log in the same shape as the ones the game uploads, with `frags`, `vehicle_frags` etc. per round.
+    The same arguments always produce the same log.
+
+    Logs generated with the same `player_pool` draw their players from the same `player_pool` ids, so that players
+    turn up in many logs and pick up a few names along the way.
+    """
+    rng = random.Random(seed)
+    started_at = started_at or datetime.datetime(2021, 3, 6, 22, 50, 23)
+    round_length = datetime.timedelta(minutes=50)
+
+    def timestamp(round_index, seconds):
+        return (started_at + round_index * round_length + datetime.timedelta(seconds=seconds)).strftime('%Y-%m-%dT%H:%M:%S')
+
+    def location():
+        return [rng.uniform(-30000, 30000), rng.uniform(-30000, 30000), rng.uniform(-500, 2000)]
+
+    if player_pool is None:
+        player_ids = rng.sample(range(FIRST_PLAYER_ID, FIRST_PLAYER_ID + 10 ** 9), players)
+    else:
+        player_ids = rng.sample(range(FIRST_PLAYER_ID, FIRST_PLAYER_ID + player_pool), min(players, player_pool))
+    teams = {player_id: i % 2 for i, player_id in enumerate(player_ids)}
+    log_length = int((rounds * round_length).total_seconds())
+
+    def actor(player_id=None, team=None):
+        player_id = player_id or rng.choice(player_ids)
+        in_vehicle = rng.random() < 0.1
+        return {
+            'id': str(player_id),
+            'team': teams[player_id] if team is None else team,
+            'location': location(),
+            'pawn': None if in_vehicle else INFANTRY_PAWNS[teams[player_id]],
+            'vehicle': rng.choice(VEHICLES) if in_vehicle else None
+        }
+
+    def player_names(player_id):
+        number = player_id - FIRST_PLAYER_ID
+        names = ['Player {}'.format(number)]
+        if number % 8 == 0:
+            # Names in the logs are encoded as cp1251, so throw in some Cyrillic.
+            names.append('Игрок {}'.format(number))
+        if rng.random() < 0.2:
+            names.append('{} {}'.format(rng.choice(WORDS).title(), rng.randint(0, 99)))
+        return names
+
+    log = {
+        'version': version,
+        'map': {
+            'name': rng.choice(MAPS),
+            'bounds': {'ne': [30000.0, 30000.0], 'sw': [-30000.0, -30000.0]},
+            'offset': 0
+        },
+        'players': [{
+            'id': str(player_id),
+            'names': player_names(player_id),
+            'sessions': [{
+                'ip': '10.0.{}.{}'.format(i // 256, i % 256),
+                'started_at': timestamp(0, 0),
+                'ended_at': timestamp(0, rng.randint(60, log_length))
+            }]
+        } for i, player_id in enumerate(player_ids)],
+        'text_messages': [{
+            'type': rng.choice(['Say', 'TeamSay', 'SquadSay']),
+            'message': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 8))),
+            'sender': str(rng.choice(player_ids)) if i % 50 else ADMIN_PLAYER_ID,
+            'sent_at': timestamp(0, rng.randint(0, log_length)),
+            'team_index': rng.randint(0, 1),
+            'squad_index': rng.randint(-1, 7)
+        } for i in range(text_messages)],
+        'rounds': []
+    }
+
+    for round_index in range(rounds):
+        frag_list = []
+        for time in sorted(rng.randint(0, int(round_length.total_seconds())) for _ in range(frags)):
+            killer = actor()
+            # The odd suicide and teamkill, but mostly kills across teams.
+            roll = rng.random()
+            if roll < 0.02:
+                victim = actor(int(killer['id']))
+            elif roll < 0.05:
+                victim = actor(rng.choice([x for x in player_ids if teams[x] == killer['team']]))
+            else:
+                victim = actor(rng.choice([x for x in player_ids if teams[x] != killer['team']]))
+            frag_list.append({
+                'damage_type': rng.choice(DAMAGE_TYPES),
+                'hit_index': rng.randint(0, 12),
+                'time': time,
+                'killer': killer,
+                'victim': victim
+            })
+        log['rounds'].append({
+            'started_at': timestamp(round_index, 0),
+            'ended_at': timestamp(round_index, round_length.total_seconds()),
+            'winner': rng.randint(0, 1),
+            'frags': frag_list,
+            'vehicle_frags': [{
+                'time': rng.randint(0, int(round_length.total_seconds())),
+                'damage_type': rng.choice(DAMAGE_TYPES),
+                'killer': actor(),
+                'destroyed_vehicle': {
+                    'vehicle': rng.choice(VEHICLES),
+                    'team': rng.randint(0, 1),
+                    'location': location()
+                }
+            } for _ in range(vehicle_frags)],
+            'rally_points': [{
+                'team_index': rng.randint(0, 1),
+                'squad_index': rng.randint(0, 7),
+                'player_id': str(rng.choice(player_ids)),
+                'is_established': rng.random() < 0.8,
+                'establisher_count': rng.randint(1, 3),
+                'location': location(),
+                'created_at': timestamp(round_index, rng.randint(0, 1500)),
+                'destroyed_at': timestamp(round_index, rng.randint(1500, 3000)) if rng.random() < 0.7 else None,
+                'destroyed_reason': rng.choice(['overrun', 'exhausted', 'damaged', 'deleted', 'replaced']),
+                'spawn_count': rng.randint(0, 20)
+            } for _ in range(rally_points)],
+            'constructions': [{
+                'class': rng.choice(CONSTRUCTIONS),
+                'player_id': str(rng.choice(player_ids)),
+                'team': rng.randint(0, 1),
+                'round_time': rng.randint(0, int(round_length.total_seconds())),
+                'location': [int(x) for x in location()]
+            } for _ in range(constructions)],
+            'events': [{
+                'type': 'egg_found',
+                'data': {'player_id': str(rng.choice(player_ids))}
+            } for _ in range(events)]
+        })
+
+    return log
+
+
+def write_log(log, file):
+    """
+    Writes `log` to `file` the way the game does, as cp1251 with line breaks.
+    """
+    file.write(json.dumps(log, ensure_ascii=False, indent=4).replace('\n', '\r\n').encode('cp1251'))
+
+
+def ingest_rolled_back(file, crc, timer=NULL_TIMER):
+    """
+    Ingests the log in `file` like `ingest.ingest_log_file`, then rolls it back so that it can be ingested again.
+    """
+    try:
+        with transaction.atomic():
+            try:
+                ingest.ingest_log(LogReader(file, timer=timer), crc)
+            except JSONDecodeError:
+                ingest.ingest_log(LogReader(file, escape_backslashes=True, timer=timer), crc)
+            raise Rollback()
+    except Rollback:
+        pass
+
+
+def generate_logs(count, players=64, player_pool=20000, rounds=3, frags=150):
+    """
+    Ingests `count` generated logs on top of those already in the database, yielding the number ingested so far after
+    each one. Logs are an hour apart and draw their players from a shared `player_pool`.
+    """
+    first_seed = models.Log.objects.count()
+    started_at = datetime.datetime(2020, 1, 1)
+    for seed in range(first_seed, first_seed + count):
+        log = generate_log(players=players, rounds=rounds, frags=frags, seed=seed, player_pool=player_pool,
+                           started_at=started_at + datetime.timedelta(hours=3 * seed))
+        with tempfile.TemporaryFile() as file:
+            write_log(log, file)
+            try:
+                ingest.ingest_log(LogReader(file), log_crc(file))
+            except DuplicateLogException:
+                pass
+        yield seed - first_seed + 1
+
+
+def get_action_params():
+    """
+    Returns the query parameters that some actions can't do without, keyed by (prefix, action), using whatever data is
+    in the database.
+    """
+    damage_type_ids = list(models.DamageTypeClass.objects.order_by('id').values_list('id', flat=True)[:3])
+    round = models.Round.objects.order_by('-id').first()
+    player_id = round.log.players.values_list('id', flat=True).first() if round else None
+    return {
+        ('frags', 'range_histogram'): {'damage_type_ids[]': damage_type_ids},
+        ('rounds', 'player_summary'): {'player_id': player_id},
+        ('players', 'damage_type_kills'): {'killer_id': player_id},
+        ('leaderboards', 'rank'): {'player_id': player_id},
+    }
+
+
+def get_endpoints(prefixes=None):
+    """
+    Yields a (name, path, query parameters) for the list, detail and GET actions of each viewset in the router, and
+    for the other views that don't take any arguments.
+    """
+    action_params = get_action_params()
+    for prefix, viewset, basename in router.registry:
+        if prefixes and prefix not in prefixes:
+            continue
+        obj = viewset.queryset.order_by('-pk').first()
+        yield '{}-list'.format(prefix), '/{}/'.format(prefix), {}
+        if obj is not None and hasattr(viewset, 'retrieve'):
+            yield '{}-detail'.format(prefix), '/{}/{}/'.format(prefix, obj.pk), {}
+        for action in viewset.get_extra_actions():
+            if 'get' not in action.mapping or '(' in action.url_path:
+                # Actions with their own URL arguments would need to be told what to put in them.
+                continue
+            params = {k: v for k, v in action_params.get((prefix, action.__name__), {}).items() if v is not None}
+            if action.detail:
+                if obj is not None:
+                    yield '{}-{}'.format(prefix, action.url_path), '/{}/{}/{}/'.format(prefix, obj.pk, action.url_path), params
+            else:
+                yield '{}-{}'.format(prefix, action.url_path), '/{}/{}/'.format(prefix, action.url_path), params
+    for pattern in urlpatterns:
+        path = str(pattern.pattern)
+        if not isinstance(pattern, URLPattern) or path.startswith('admin') or '<' in path or '(' in path:
+            continue
+        if prefixes and path.split('/')[0] not in prefixes:
+            continue
+        yield path.rstrip('/'), '/' + path, {}
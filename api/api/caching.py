@@ -0,0 +1,175 @@
+import hashlib
+import json
+from calendar import timegm
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from . import models
+from .db import add_counts
+
+# Endpoints that read from every log, rather than from a particular map, round or player, depend on this.
+ALL_LOGS = ('logs', 'all')
+
+# Every cached response depends on this, so that rebuilding the stats can invalidate all of them at once.
+EVERYTHING = ('everything', 'all')
+
+# The names of the endpoints that are cached, for reporting their hits and misses.
+ENDPOINTS = []
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE]
+
+
+def get_generation_key(entity):
+    return '{}:{}'.format(*entity)
+
+
+def get_generation_rows(entities):
+    keys = [get_generation_key(x) for x in list(entities) + [EVERYTHING]]
+    rows = {x[0]: x[1:] for x in models.CacheGeneration.objects.filter(key__in=keys)
+            .values_list('key', 'generation', 'updated_at')}
+    return [rows.get(key, (0, None)) for key in keys]
+
+
+def get_generations(entities):
+    """
+    Returns the current generation of each of `entities`, a list of (kind, id) like ('map', 5), followed by that of
+    `EVERYTHING`. Generations are kept in the database rather than the cache, so that every process sees the same ones
+    and they can't be evicted.
+    """
+    return [x[0] for x in get_generation_rows(entities)]
+
+
+def get_version(entities):
+    """
+    Returns the version of the data of `entities` (their generations) and when it last changed, for
+    `conditional_response`. Generations are only bumped once the log that changed them has been committed, so a client
+    that has seen a version has also seen the data that came with it.
+    """
+    rows = get_generation_rows(entities)
+    updated_at = [x[1] for x in rows if x[1] is not None]
+    return [x[0] for x in rows], max(updated_at) if len(updated_at) > 0 else None
+
+
+def bump_generations(entities):
+    """
+    Moves each of `entities` on to a new generation, so that responses that depend on them are no longer served.
+    """
+    add_counts(models.CacheGeneration, ('key',), {(get_generation_key(x),): {'generation': 1} for x in entities},
+               replace=('updated_at',))
+
+
+def invalidate_log(log, round_ids, player_ids):
+    bump_generations([ALL_LOGS, ('map', log.map_id)] + [('round', x) for x in round_ids] +
+                     [('player', x) for x in player_ids])
+
+
+def invalidate_all():
+    bump_generations([EVERYTHING])
+    # Nothing will be served from it anymore, so make room straight away.
+    get_cache().clear()
+
+
+def record(endpoint, outcome):
+    cache = get_cache()
+    key = 'metrics:{}:{}'.format(endpoint, outcome)
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted in the meantime.
+            cache.add(key, 1, None)
+
+
+def get_metrics():
+    """
+    Returns the number of hits and misses of each endpoint since the metrics were last reset.
+    """
+    cache = get_cache()
+    keys = ['metrics:{}:{}'.format(x, y) for x in ENDPOINTS for y in ('hit', 'miss')]
+    counts = cache.get_many(keys)
+    return {x: {
+        'hits': counts.get('metrics:{}:hit'.format(x), 0),
+        'misses': counts.get('metrics:{}:miss'.format(x), 0)
+    } for x in ENDPOINTS}
+
+
+def reset_metrics():
+    get_cache().delete_many(['metrics:{}:{}'.format(x, y) for x in ENDPOINTS for y in ('hit', 'miss')])
+
+
+def cached_response(endpoint, depends_on=lambda request, **kwargs: [ALL_LOGS]):
+    """
+    Caches the successful responses of a view by its query parameters and URL arguments. `depends_on` returns the
+    entities whose data went into the response, given the same arguments as the view. Responses are kept until one of
+    those entities moves on to a new generation (see `bump_generations`), until they're evicted to make room, or at most
+    for `RESPONSE_CACHE_TIMEOUT` seconds.
+    """
+    ENDPOINTS.append(endpoint)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # Function views are called with the request, viewset actions with the viewset and then the request.
+            request = args[-1]
+            if not settings.RESPONSE_CACHE_ENABLED:
+                return view(*args, **kwargs)
+            entities = depends_on(request, **kwargs)
+            key = json.dumps([sorted(request.GET.lists()), sorted(kwargs.items()), get_generations(entities)],
+                             default=str)
+            key = 'response:{}:{}'.format(endpoint, hashlib.md5(key.encode()).hexdigest())
+            cache = get_cache()
+            cached = cache.get(key)
+            if cached is not None:
+                record(endpoint, 'hit')
+                if cached[0] == 'data':
+                    return Response(cached[1])
+                return HttpResponse(cached[1], content_type=cached[2])
+            record(endpoint, 'miss')
+            response = view(*args, **kwargs)
+            if response.status_code == 200:
+                # Responses from viewsets haven't been rendered yet, so keep their data instead.
+                if isinstance(response, Response):
+                    cache.set(key, ('data', response.data))
+                else:
+                    cache.set(key, ('content', response.content, response['Content-Type']))
+            return response
+        return wrapper
+    return decorator
+
+
+def conditional_response(get_version):
+    """
+    Gives the responses of a view an ETag and a Last-Modified date, and answers requests that already have the current
+    version with 304 Not Modified without calling the view. `get_version` returns the version of the data that went into
+    the response and when it last changed (or None), given the same arguments as the view. It should be much cheaper
+    than the view itself.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            request = args[-1]
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+            version, last_modified = get_version(request, **kwargs)
+            # The browsable API and JSON are different representations of the same URL, so their tags have to differ.
+            etag = json.dumps([version, request.META.get('HTTP_ACCEPT', '')], default=str)
+            etag = quote_etag(hashlib.md5(etag.encode()).hexdigest())
+            last_modified = timegm(last_modified.utctimetuple()) if last_modified is not None else None
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(*args, **kwargs)
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                if last_modified is not None:
+                    response['Last-Modified'] = http_date(last_modified)
+            return response
+        return wrapper
+    return decorator
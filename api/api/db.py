@@ -0,0 +1,150 @@
+import binascii
+import datetime
+import io
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import AutoField, BigIntegerField, F, Value
+from django.db.models.functions import Cast
+from django.db.models.sql import Query
+
+# Rows are inserted this many at a time, to keep the size of each INSERT in check.
+BATCH_SIZE = 1000
+
+
+def advisory_lock(namespace, *keys):
+    """
+    Takes transaction-scoped advisory locks on each of `keys` within `namespace`, blocking until any concurrent
+    transaction holding the same keys commits. Keys are locked in a fixed order so that two transactions locking
+    overlapping sets of keys can't deadlock.
+
+    This is a no-op on databases without advisory locks (ie. SQLite), which only ever allow one writer at a time.
+    """
+    if connection.vendor != 'postgresql' or len(keys) == 0:
+        return
+    namespace_id = binascii.crc32(namespace.encode())
+    lock_ids = set()
+    for key in keys:
+        lock_id = (namespace_id << 32) | binascii.crc32(str(key).encode())
+        # pg_advisory_xact_lock takes a signed bigint
+        lock_ids.add(lock_id - (1 << 64) if lock_id >= (1 << 63) else lock_id)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(id) FROM (SELECT unnest(%s::bigint[]) AS id ORDER BY id) AS ids',
+                       [sorted(lock_ids)])
+
+
+def get_or_create_many(model, field, values):
+    """
+    Returns a dict of `values` to the instances of `model` whose unique `field` matches them, creating any that don't
+    exist yet. Rows are inserted with ON CONFLICT DO NOTHING, so concurrent callers racing to create the same rows
+    don't fail.
+    """
+    values = set(values)
+    values.discard(None)
+    instances = {getattr(x, field): x for x in model.objects.filter(**{field + '__in': values})}
+    missing = values - set(instances.keys())
+    if len(missing) > 0:
+        # Rows are inserted in a fixed order so that two callers inserting overlapping values can't deadlock.
+        model.objects.bulk_create([model(**{field: value}) for value in sorted(missing)], ignore_conflicts=True)
+        instances.update({getattr(x, field): x for x in model.objects.filter(**{field + '__in': missing})})
+    return instances
+
+
+def add_counts(model, fields, counts, condition=None, replace=()):
+    """
+    Adds each of `counts`, a dict of tuples of `fields` values to a dict of columns to increments, onto the row of
+    `model` with those values, creating the rows that don't exist yet. Each batch is a single INSERT ... ON CONFLICT
+    DO UPDATE, so `fields` have to be unique together, or unique together where `condition` (a Q object matching that
+    of a partial unique constraint) holds. The `replace` fields of existing rows are overwritten with those of the new
+    rows instead (eg. an `auto_now` date). Rows are written in a fixed order so that concurrent callers can't deadlock.
+    """
+    if len(counts) == 0:
+        return
+    objs = [model(**dict(zip(fields, key)), **counts[key]) for key in sorted(counts.keys())]
+    count_columns = [model._meta.get_field(x).column for x in sorted(set().union(*counts.values()))]
+    insert_fields = [x for x in model._meta.concrete_fields if not isinstance(x, AutoField)]
+    quote_name = connection.ops.quote_name
+    table = quote_name(model._meta.db_table)
+    target = '({})'.format(', '.join(quote_name(model._meta.get_field(x).column) for x in fields))
+    target_params = []
+    if condition is not None:
+        # The target has to repeat the constraint's condition for its partial unique index to be picked, and may only
+        # refer to the columns unqualified.
+        query = Query(model)
+        where_sql, target_params = query.build_where(condition).as_sql(query.get_compiler(connection=connection),
+                                                                        connection)
+        target += ' WHERE ' + where_sql.replace(table + '.', '')
+    sql = 'INSERT INTO {} ({}) VALUES {{}} ON CONFLICT {} DO UPDATE SET {}'.format(
+        table,
+        ', '.join(quote_name(x.column) for x in insert_fields),
+        target.replace('{', '{{').replace('}', '}}'),
+        ', '.join(['{0} = {1}.{0} + EXCLUDED.{0}'.format(quote_name(x), table) for x in count_columns] +
+                  ['{0} = EXCLUDED.{0}'.format(quote_name(model._meta.get_field(x).column)) for x in replace])
+    )
+    row_placeholder = '({})'.format(', '.join(['%s'] * len(insert_fields)))
+    batch_size = max(min(BATCH_SIZE, connection.ops.bulk_batch_size(insert_fields, objs)), 1)
+    with connection.cursor() as cursor:
+        for i in range(0, len(objs), batch_size):
+            batch = objs[i:i + batch_size]
+            params = [x.get_db_prep_save(x.pre_save(obj, True), connection) for obj in batch for x in insert_fields]
+            cursor.execute(sql.format(', '.join([row_placeholder] * len(batch))), params + list(target_params))
+
+
+def bulk_create_with_ids(model, objs):
+    """
+    Inserts `objs` like `bulk_create`, making sure each of them ends up with its primary key set so that rows
+    referencing them can be created afterwards.
+    """
+    if connection.features.can_return_ids_from_bulk_insert:
+        return model.objects.bulk_create(objs)
+    # Only PostgreSQL hands back the ids of bulk inserted rows, elsewhere we have to insert them one at a time.
+    for obj in objs:
+        obj.save(force_insert=True)
+    return objs
+
+
+def duration_increment(field, delta):
+    """
+    Returns an expression adding the timedelta `delta` to the DurationField `field`, for use in `update()`.
+    """
+    if connection.features.has_native_duration_field:
+        return F(field) + delta
+    # Durations are stored as microseconds where there's no native type, and adding two of them together there comes
+    # out as a string in Django 2.2, so do the arithmetic on the integers ourselves.
+    return Cast(F(field), BigIntegerField()) + Value(delta // datetime.timedelta(microseconds=1))
+
+
+def bulk_insert(model, objs):
+    """
+    Inserts `objs` without handing back their ids. With `INGEST_USE_COPY` enabled on PostgreSQL the rows are streamed
+    through a single COPY, which is several times faster than INSERTing them; everywhere else they're INSERTed in
+    batches of `BATCH_SIZE`.
+    """
+    fields = [x for x in model._meta.concrete_fields if not isinstance(x, AutoField)]
+    if not (settings.INGEST_USE_COPY and connection.vendor == 'postgresql'):
+        objs = list(objs)
+        # An explicit batch size takes precedence over the backend's own limits, so respect those ourselves (SQLite
+        # can't take more than 999 parameters or 500 rows in one INSERT).
+        batch_size = min(BATCH_SIZE, connection.ops.bulk_batch_size(fields, objs))
+        model.objects.bulk_create(objs, batch_size=max(batch_size, 1))
+        return
+    data = io.StringIO()
+    for obj in objs:
+        data.write(','.join(copy_value(x.get_db_prep_save(x.pre_save(obj, True), connection)) for x in fields))
+        data.write('\n')
+    data.seek(0)
+    sql = 'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+        connection.ops.quote_name(model._meta.db_table),
+        ', '.join(connection.ops.quote_name(x.column) for x in fields)
+    )
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, data)
+
+
+def copy_value(value):
+    # In CSV, COPY reads an unquoted empty value as NULL and a quoted one as an empty string.
+    if value is None:
+        return ''
+    if isinstance(value, (bool, int, float)):
+        return str(value)
+    return '"' + str(value).replace('"', '""') + '"'
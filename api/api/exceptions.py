@@ -16,4 +16,18 @@ class MissingParametersException(BaseCustomException):
 
     def __init__(self, parameters):
         error_message = 'Missing parameters: ' + ', '.join(parameters)
-        BaseCustomException.__init__(self, error_message)
\ No newline at end of file
+        BaseCustomException.__init__(self, error_message)
+
+class DuplicateLogException(BaseCustomException):
+    status_code = 409
+
+    def __init__(self, crc):
+        error_message = 'Log {} has already been ingested.'.format(crc)
+        BaseCustomException.__init__(self, error_message)
+
+class UnsupportedLogVersionException(BaseCustomException):
+    status_code = 406
+
+    def __init__(self, version):
+        error_message = 'Log file version {} is unsupported.'.format(version)
+        BaseCustomException.__init__(self, error_message)
@@ -0,0 +1,111 @@
+from collections import Counter
+
+import numpy as np
+
+from . import models
+from .db import add_counts, advisory_lock
+from .leaderboards import get_week
+
+# Zoom level z splits the map bounds into a 2^z by 2^z grid. Cells are only counted at the finest level as logs come
+# in, and are added up into the cells of the coarser levels when they're read.
+ZOOM_LEVELS = (4, 5, 6, 7)
+MAX_ZOOM = max(ZOOM_LEVELS)
+DEFAULT_ZOOM = 6
+
+
+def get_bounds(map):
+    """
+    Returns the (min_x, min_y, max_x, max_y) of the map, or None if it has no usable bounds.
+    """
+    xs = (map.bounds_ne_x, map.bounds_sw_x)
+    ys = (map.bounds_ne_y, map.bounds_sw_y)
+    if None in xs or None in ys or xs[0] == xs[1] or ys[0] == ys[1]:
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def get_cell_size(bounds, zoom):
+    min_x, min_y, max_x, max_y = bounds
+    return (max_x - min_x) / 2 ** zoom, (max_y - min_y) / 2 ** zoom
+
+
+def get_zoom_for_cell_size(bounds, cell_size):
+    """
+    Returns the zoom level whose cells are closest to `cell_size` units across.
+    """
+    return min(ZOOM_LEVELS, key=lambda zoom: abs(get_cell_size(bounds, zoom)[0] - cell_size))
+
+
+def count_cells(counts, bounds, started_at, xs, ys, team_indices, damage_type_ids):
+    """
+    Adds one to `counts` for the cell that each location falls in at the finest zoom level, keyed by
+    (week, team_index, damage_type_id, x, y), where the week is the one the round started in. Locations outside of the
+    bounds are left out.
+    """
+    if len(xs) == 0:
+        return
+    min_x, min_y, max_x, max_y = bounds
+    xs = (np.asarray(xs, dtype=np.float64) - min_x) / (max_x - min_x)
+    ys = (np.asarray(ys, dtype=np.float64) - min_y) / (max_y - min_y)
+    inside = (xs >= 0) & (xs < 1) & (ys >= 0) & (ys < 1)
+    xs, ys = xs[inside], ys[inside]
+    team_indices = np.asarray(team_indices, dtype=np.int64)[inside]
+    damage_type_ids = np.asarray(damage_type_ids, dtype=np.int64)[inside]
+    cells = np.stack((
+        team_indices,
+        damage_type_ids,
+        (xs * 2 ** MAX_ZOOM).astype(np.int64),
+        (ys * 2 ** MAX_ZOOM).astype(np.int64)
+    ), axis=1)
+    keys, key_counts = np.unique(cells, axis=0, return_counts=True)
+    week = get_week(started_at)
+    for (team_index, damage_type_id, x, y), count in zip(keys.tolist(), key_counts.tolist()):
+        counts[(week, team_index, damage_type_id, x, y)] += count
+
+
+def save_cells(map_id, counts, clear=False):
+    """
+    Adds `counts` (see `count_cells`) onto the map's stored heatmap cells, or replaces them with `counts` if `clear`.
+
+    Ingest already holds the locks of its players by now, so this takes the map's lock last, and only once.
+    """
+    if len(counts) == 0 and not clear:
+        return
+    # Rebuilding a map's cells starts from scratch, so logs on the map wait for that to finish.
+    advisory_lock('heatmap', map_id)
+    if clear:
+        models.HeatmapCell.objects.filter(map_id=map_id).delete()
+    add_counts(models.HeatmapCell, ('map_id', 'week', 'team_index', 'damage_type_id', 'x', 'y'),
+               {(map_id,) + key: {'count': count} for key, count in counts.items()})
+
+
+def rebuild_cells(map):
+    """
+    Recounts the heatmap cells of a map from all of its frags.
+    """
+    # Logs on the map wait until it's been recounted, so that their frags are either counted here or added on after.
+    advisory_lock('heatmap', map.id)
+    counts = Counter()
+    bounds = get_bounds(map)
+    if bounds is None:
+        save_cells(map.id, counts, clear=True)
+        return 0
+    frags = models.Frag.objects.filter(round__log__map=map).order_by('round_id').values_list(
+        'round__started_at', 'victim_location_x', 'victim_location_y', 'victim_team_index', 'damage_type_id'
+    )
+    rows = []
+    for row in frags.iterator():
+        if len(rows) > 0 and row[0] != rows[0][0]:
+            count_round_cells(counts, bounds, rows)
+            rows = []
+        rows.append(row)
+    count_round_cells(counts, bounds, rows)
+    save_cells(map.id, counts, clear=True)
+    return len(counts)
+
+
+def count_round_cells(counts, bounds, rows):
+    if len(rows) == 0:
+        return
+    _, xs, ys, team_indices, damage_type_ids = zip(*rows)
+    count_cells(counts, bounds, rows[0][0], xs, ys, team_indices, damage_type_ids)
@@ -0,0 +1,581 @@
+import datetime
+import json
+import logging
+import os
+import shutil
+import tempfile
+from collections import Counter, OrderedDict, defaultdict
+from json.decoder import JSONDecodeError
+
+import numpy as np
+import pytz
+import semver
+from dateutil import parser
+from dateutil.utils import default_tzinfo
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import activity
+from . import caching
+from . import heatmap
+from . import leaderboards
+from . import models
+from . import words
+from .db import BATCH_SIZE, advisory_lock, bulk_create_with_ids, bulk_insert, duration_increment, get_or_create_many
+from .exceptions import BaseCustomException, DuplicateLogException, UnsupportedLogVersionException
+from .logreader import LogReader
+
+logger = logging.getLogger(__name__)
+
+LOG_JOB_CHUNK_SIZE = 1024 * 1024
+
+
+def parse_dt(timestr: str):
+    return default_tzinfo(parser.parse(timestr), pytz.UTC)
+
+
+def ingest_log_file(file, crc):
+    """
+    Reads a log from `file` and writes it to the database, returning the new `Log`.
+
+    Raises `DuplicateLogException` if a log with the same CRC has already been ingested and
+    `UnsupportedLogVersionException` if the log is too old to be ingested.
+    """
+    try:
+        log = ingest_log(LogReader(file), crc)
+    except JSONDecodeError:
+        # Versions <=v9.0.9 had a bug where backslashes and double-quotes were not being properly escaped
+        # and therefore couldn't be parsed properly. If we run into a decoding error, attempt to escape the
+        # backslashes and load it up again.
+        log = ingest_log(LogReader(file, escape_backslashes=True), crc)
+    store_log_file(file, crc)
+    return log
+
+
+def ingest_log(reader, crc):
+    """
+    Writes the log read by `reader` to the database. Time spent in each phase is reported to `reader.timer`.
+    """
+    timer = reader.timer
+    data = reader.read_header()
+
+    # ensure that this log hasn't been evaluated before
+    if models.Log.objects.filter(crc=crc).exists():
+        raise DuplicateLogException(crc)
+
+    # version gate
+    if semver.compare(data['version'][1:], '8.3.0') < 0:
+        raise UnsupportedLogVersionException(data['version'][1:])
+
+    with transaction.atomic():
+        log = models.Log()
+        log.crc = crc
+        log.version = data['version']
+
+        with timer.phase('resolve'):
+            map_data = data['map']
+            log.map = get_or_create_many(models.Map, 'name', [map_data['name']])[map_data['name']]
+            bounds = (map_data['bounds']['ne'][0], map_data['bounds']['ne'][1],
+                      map_data['bounds']['sw'][0], map_data['bounds']['sw'][1], map_data['offset'])
+            # Only touch the map row if something changed, otherwise concurrent logs on the same map would queue up on
+            # its row lock.
+            clear_heatmap = False
+            if bounds != (log.map.bounds_ne_x, log.map.bounds_ne_y, log.map.bounds_sw_x, log.map.bounds_sw_y, log.map.offset):
+                old_heatmap_bounds = heatmap.get_bounds(log.map)
+                log.map.bounds_ne_x, log.map.bounds_ne_y, log.map.bounds_sw_x, log.map.bounds_sw_y, log.map.offset = bounds
+                log.map.save()
+                if old_heatmap_bounds is not None and heatmap.get_bounds(log.map) != old_heatmap_bounds:
+                    # The heatmap grid follows the bounds, so what was counted so far no longer lines up with it. The
+                    # cells are cleared along with saving this log's, once the players are locked.
+                    logger.warning('Bounds of %s changed, its heatmap needs rebuilding with `rebuild_heatmaps`', log.map.name)
+                    clear_heatmap = True
+            heatmap_bounds = heatmap.get_bounds(log.map)
+
+            player_ids = [int(x['id']) for x in data['players']]
+            players_by_id = get_or_create_many(models.Player, 'id', player_ids)
+
+            # Names, sessions and stats of a player are read and written by every log they appear in, so logs that
+            # share players take turns here. Logs with no players in common don't block each other.
+            advisory_lock('player', *player_ids)
+
+        with timer.phase('insert_log'):
+            try:
+                log.save()
+            except IntegrityError:
+                # The same log was uploaded again and ingested alongside this one, which got past the check above
+                # before the other one was committed.
+                raise DuplicateLogException(crc)
+            models.Log.players.through.objects.bulk_create(
+                map(lambda player_id: models.Log.players.through(log_id=log.id, player_id=player_id), set(player_ids))
+            )
+
+        player_stats = PlayerStatsDelta()
+        leaderboard = LeaderboardDelta(log.map.id)
+
+        # sessions
+        with timer.phase('insert_sessions'):
+            sessions = []
+            for player_data in data['players']:
+                player_id = int(player_data['id'])
+                for session_data in player_data['sessions']:
+                    session = models.Session()
+                    session.ip = session_data['ip']
+                    session.started_at = parse_dt(session_data['started_at'])
+                    if semver.compare(data['version'][1:], '9.0.9') <= 0:
+                        if session_data['ended_at'] == '':
+                            # There was a bug with <=v9.0.9 where player timeouts would not terminate sessions,
+                            # resulting in ended_at being an empty string. This fix effectively terminates the session
+                            # immediately.
+                            session.ended_at = parse_dt(session_data['started_at'])
+                        else:
+                            session.ended_at = parse_dt(session_data['ended_at'])
+                    else:
+                        session.ended_at = parse_dt(session_data['ended_at'])
+                    sessions.append((player_id, session))
+                    player_stats.add_session(player_id, session)
+                    leaderboard.add_session(player_id, session)
+            bulk_create_with_ids(models.Session, [x[1] for x in sessions])
+            models.Player.sessions.through.objects.bulk_create(
+                map(lambda x: models.Player.sessions.through(player_id=x[0], session_id=x[1].id), sessions)
+            )
+            activity.add_activity(activity.count_sessions(sessions))
+
+        # names
+        with timer.phase('insert_names'):
+            player_names = set(models.Player.names.through.objects.filter(player_id__in=player_ids)
+                               .values_list('player_id', 'playername__name'))
+            new_player_names = []
+            for player_data in data['players']:
+                player_id = int(player_data['id'])
+                for name in player_data['names']:
+                    if (player_id, name) not in player_names:
+                        player_names.add((player_id, name))
+                        new_player_names.append((player_id, models.PlayerName(name=name)))
+            bulk_create_with_ids(models.PlayerName, [x[1] for x in new_player_names])
+            models.Player.names.through.objects.bulk_create(
+                map(lambda x: models.Player.names.through(player_id=x[0], playername_id=x[1].id), new_player_names)
+            )
+            # The last name a player went by in this log becomes their name.
+            renamed_players = []
+            for player_data in data['players']:
+                player = players_by_id[int(player_data['id'])]
+                if len(player_data['names']) > 0 and player.name != player_data['names'][-1]:
+                    player.name = player_data['names'][-1]
+                    renamed_players.append(player)
+            models.Player.objects.bulk_update(renamed_players, ['name'], batch_size=BATCH_SIZE)
+
+        # text messages
+        with timer.phase('insert_text_messages'):
+            admin_player_id = "20b300195d48c2ccc2651885cfea1a2f"
+            text_messages = list(map(lambda text_message: models.TextMessage(
+                log=log,
+                type=text_message['type'],
+                message=text_message['message'][:128],
+                sender=players_by_id[int(text_message['sender'])],
+                sent_at=parse_dt(text_message['sent_at']),
+                team_index=text_message['team_index'],
+                squad_index=text_message['squad_index']
+            ), filter(lambda x: x['sender'] != admin_player_id, data['text_messages'])))
+            bulk_insert(models.TextMessage, text_messages)
+            bulk_insert(models.WordCount, words.get_word_counts(log, text_messages))
+
+        damage_type_ids = {None: None}
+        pawn_class_ids = {None: None}
+        construction_class_ids = {None: None}
+        round_summaries = []
+        damage_type_summaries = []
+        heatmap_counts = Counter()
+
+        # rounds
+        for round_data in reader.iter_rounds():
+            # Look up any classes we haven't seen in an earlier round.
+            with timer.phase('resolve'):
+                damage_type_ids.update(get_ids(
+                    models.DamageTypeClass, get_unique_damage_types(round_data) - damage_type_ids.keys()
+                ))
+                pawn_class_ids.update(get_ids(
+                    models.PawnClass, get_unique_pawn_classes(round_data) - pawn_class_ids.keys()
+                ))
+                construction_class_ids.update(get_ids(
+                    models.ConstructionClass, get_unique_construction_classes(round_data) - construction_class_ids.keys()
+                ))
+
+            with timer.phase('insert_rounds'):
+                round = models.Round()
+                round.started_at = parse_dt(round_data['started_at'])
+                round.ended_at = None if round_data['ended_at'] is None else parse_dt(round_data['ended_at'])
+                round.winner = round_data['winner']
+                round.log = log
+                round.save()
+
+            # 2.6s the time to beat on 2021-03-06T22_50_23.log
+
+            with timer.phase('insert_frags'):
+                frag_columns = get_frag_columns(round_data['frags'], damage_type_ids, pawn_class_ids)
+                bulk_insert(models.Frag, build_rows(models.Frag, frag_columns, round_id=round.id))
+
+            with timer.phase('stats'):
+                player_stats.add_frags(frag_columns['killer_id'], frag_columns['killer_team_index'],
+                                       frag_columns['victim_id'], frag_columns['victim_team_index'])
+                leaderboard.add_frags(round.started_at, frag_columns['killer_id'], frag_columns['killer_team_index'],
+                                      frag_columns['victim_id'], frag_columns['victim_team_index'])
+                round_summaries.append(get_round_summary(round, frag_columns, len(set(player_ids))))
+                damage_type_summaries.extend(get_damage_type_summaries(round, log, frag_columns))
+
+            if heatmap_bounds is not None:
+                with timer.phase('heatmap'):
+                    heatmap.count_cells(heatmap_counts, heatmap_bounds, round.started_at,
+                                        frag_columns['victim_location_x'], frag_columns['victim_location_y'],
+                                        frag_columns['victim_team_index'], frag_columns['damage_type_id'])
+
+            with timer.phase('insert_vehicle_frags'):
+                vehicle_frag_columns = get_vehicle_frag_columns(round_data['vehicle_frags'], damage_type_ids, pawn_class_ids)
+                bulk_insert(models.VehicleFrag, build_rows(models.VehicleFrag, vehicle_frag_columns, round_id=round.id))
+
+            # rally points
+            with timer.phase('insert_rally_points'):
+                bulk_insert(
+                    models.RallyPoint,
+                    map(lambda rally_point: models.RallyPoint(
+                        team_index=rally_point['team_index'],
+                        squad_index=rally_point['squad_index'],
+                        player_id=players_by_id[int(rally_point['player_id'])].id,
+                        is_established=rally_point['is_established'],
+                        establisher_count=rally_point['establisher_count'],
+                        location_x=rally_point['location'][0],
+                        location_y=rally_point['location'][1],
+                        location_z=rally_point['location'][2],
+                        created_at=parse_dt(rally_point['created_at']),
+                        destroyed_at=None if rally_point['destroyed_at'] is None else parse_dt(rally_point['destroyed_at']),
+                        destroyed_reason=rally_point['destroyed_reason'],
+                        spawn_count=rally_point['spawn_count'],
+                        round_id=round.id
+                    ), round_data['rally_points'])
+                )
+
+            # constructions
+            with timer.phase('insert_constructions'):
+                bulk_insert(
+                    models.Construction,
+                    map(lambda construction_data: models.Construction(
+                        classname_id=construction_class_ids[construction_data['class']],
+                        player_id=players_by_id[int(construction_data['player_id'])].id,
+                        team_index=construction_data['team'],
+                        round_time=construction_data['round_time'],
+                        location_x=construction_data['location'][0],
+                        location_y=construction_data['location'][1],
+                        location_z=construction_data['location'][2],
+                        round_id=round.id
+                    ), round_data['constructions'])
+                )
+
+            if 'events' in round_data:
+                with timer.phase('insert_events'):
+                    bulk_insert(
+                        models.Event,
+                        map(lambda event_data: models.Event(
+                            type=event_data['type'],
+                            data=json.dumps(event_data['data']),
+                            round_id=round.id
+                        ), round_data['events'])
+                    )
+
+        with timer.phase('insert_rounds'):
+            models.RoundSummary.objects.bulk_create(round_summaries)
+            bulk_insert(models.DamageTypeSummary, damage_type_summaries)
+
+        with timer.phase('heatmap'):
+            heatmap.save_cells(log.map.id, heatmap_counts, clear=clear_heatmap)
+
+        # Add this log's contribution to the aggregate stats of the players involved in the game. Recounting them
+        # with `Player.calculate_stats` gets slower the longer a player's history is, so that's left for repairs.
+        with timer.phase('stats'):
+            player_stats.apply()
+            leaderboard.apply()
+
+        # Cached responses that this log changes the answer to stop being served once it's committed.
+        transaction.on_commit(lambda: caching.invalidate_log(log, [x.round_id for x in round_summaries], player_ids))
+
+    return log
+
+
+def store_log_file(file, crc):
+    # TODO: store the log on disk, gzip'd probably
+    log_path = os.path.join('storage', 'logs', str(crc) + '.log')
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    file.seek(0)
+    with open(log_path, 'wb') as f:
+        shutil.copyfileobj(file, f)
+
+
+class PlayerStatsDelta(object):
+    """
+    Accumulates the kills, deaths and playtime a log adds to each of its players, matching what
+    `Player.calculate_stats` would count for them.
+    """
+
+    def __init__(self):
+        self.stats = defaultdict(lambda: {
+            'kills': 0,
+            'deaths': 0,
+            'ff_kills': 0,
+            'ff_deaths': 0,
+            'playtime': datetime.timedelta()
+        })
+
+    def add_session(self, player_id, session):
+        self.stats[player_id]['playtime'] += session.duration
+
+    def add_frags(self, killer_ids, killer_team_indices, victim_ids, victim_team_indices):
+        for killer_id, killer_team_index, victim_id, victim_team_index in \
+                zip(killer_ids, killer_team_indices, victim_ids, victim_team_indices):
+            self.stats[killer_id]['kills'] += 1
+            self.stats[victim_id]['deaths'] += 1
+            if killer_id != victim_id and killer_team_index == victim_team_index:
+                self.stats[killer_id]['ff_kills'] += 1
+                self.stats[victim_id]['ff_deaths'] += 1
+
+    def apply(self):
+        for player_id, stats in self.stats.items():
+            models.Player.objects.filter(id=player_id).update(
+                kills=F('kills') + stats['kills'],
+                deaths=F('deaths') + stats['deaths'],
+                ff_kills=F('ff_kills') + stats['ff_kills'],
+                ff_deaths=F('ff_deaths') + stats['ff_deaths'],
+                playtime=duration_increment('playtime', stats['playtime'])
+            )
+
+
+class LeaderboardDelta(object):
+    """
+    Accumulates what a log adds to its players' leaderboard entries: of all time, on the log's map, and of the weeks
+    that its sessions and rounds started in.
+    """
+
+    def __init__(self, map_id):
+        self.map_id = map_id
+        self.deltas = defaultdict(PlayerStatsDelta)
+
+    def get_deltas(self, started_at):
+        return [self.deltas[x] for x in ((None, None), (self.map_id, None), (None, leaderboards.get_week(started_at)))]
+
+    def add_session(self, player_id, session):
+        for delta in self.get_deltas(session.started_at):
+            delta.add_session(player_id, session)
+
+    def add_frags(self, started_at, killer_ids, killer_team_indices, victim_ids, victim_team_indices):
+        for delta in self.get_deltas(started_at):
+            delta.add_frags(killer_ids, killer_team_indices, victim_ids, victim_team_indices)
+
+    def apply(self):
+        leaderboards.add_entries({(player_id,) + key: stats for key, delta in self.deltas.items()
+                                  for player_id, stats in delta.stats.items()})
+
+
+def get_round_summary(round, frag_columns, num_players):
+    victim_team_indices = frag_columns['victim_team_index']
+    kills = len(victim_team_indices)
+    return models.RoundSummary(
+        round_id=round.id,
+        kills=kills,
+        axis_deaths=victim_team_indices.count(0),
+        allied_deaths=victim_team_indices.count(1),
+        num_players=num_players,
+        duration=round.ended_at - round.started_at if round.ended_at is not None else None,
+        is_interesting=num_players > 1 and kills > 0
+    )
+
+
+def get_damage_type_summaries(round, log, frag_columns):
+    summaries = dict()
+    for damage_type_id, killer_id, killer_team_index, victim_id, victim_team_index in zip(
+            frag_columns['damage_type_id'], frag_columns['killer_id'], frag_columns['killer_team_index'],
+            frag_columns['victim_id'], frag_columns['victim_team_index']):
+        if damage_type_id not in summaries:
+            summaries[damage_type_id] = models.DamageTypeSummary(
+                round_id=round.id, map_id=log.map_id, version=log.version, started_at=round.started_at,
+                damage_type_id=damage_type_id
+            )
+        summary = summaries[damage_type_id]
+        summary.kills += 1
+        if killer_id == victim_id:
+            summary.suicides += 1
+        elif killer_team_index == victim_team_index:
+            summary.team_kills += 1
+    return summaries.values()
+
+
+def get_ids(model, classnames):
+    return {classname: x.id for classname, x in get_or_create_many(model, 'classname', classnames).items()}
+
+
+def get_locations(actors_data):
+    return np.array([x['location'] for x in actors_data], dtype=np.float64).reshape(-1, 3)
+
+
+def get_distances(from_locations, to_locations):
+    # Rounded to the nearest (even) whole unit, the same as PostgreSQL does with the floats that used to be stored.
+    return np.rint(np.linalg.norm(to_locations - from_locations, axis=1)).astype(np.int64).tolist()
+
+
+def get_frag_columns(frags_data, damage_type_ids, pawn_class_ids):
+    """
+    Gathers the fields of a round's frags column by column, so that the distances can be worked out for all of them in
+    one go rather than one frag at a time.
+    """
+    killers_data = [x['killer'] for x in frags_data]
+    victims_data = [x['victim'] for x in frags_data]
+    killer_locations = get_locations(killers_data)
+    victim_locations = get_locations(victims_data)
+    return OrderedDict((
+        ('damage_type_id', [damage_type_ids[x['damage_type']] for x in frags_data]),
+        ('hit_index', [x['hit_index'] for x in frags_data]),
+        ('time', [x['time'] for x in frags_data]),
+        ('killer_id', [int(x['id']) for x in killers_data]),
+        ('killer_team_index', [x['team'] for x in killers_data]),
+        ('killer_location_x', killer_locations[:, 0].tolist()),
+        ('killer_location_y', killer_locations[:, 1].tolist()),
+        ('killer_location_z', killer_locations[:, 2].tolist()),
+        ('killer_pawn_class_id', [pawn_class_ids[x['pawn']] for x in killers_data]),
+        ('killer_vehicle_id', [pawn_class_ids[x['vehicle']] for x in killers_data]),
+        ('victim_id', [int(x['id']) for x in victims_data]),
+        ('victim_team_index', [x['team'] for x in victims_data]),
+        ('victim_location_x', victim_locations[:, 0].tolist()),
+        ('victim_location_y', victim_locations[:, 1].tolist()),
+        ('victim_location_z', victim_locations[:, 2].tolist()),
+        ('victim_pawn_class_id', [pawn_class_ids[x['pawn']] for x in victims_data]),
+        ('distance', get_distances(killer_locations, victim_locations))
+    ))
+
+
+def get_vehicle_frag_columns(vehicle_frags_data, damage_type_ids, pawn_class_ids):
+    killers_data = [x['killer'] for x in vehicle_frags_data]
+    vehicles_data = [x['destroyed_vehicle'] for x in vehicle_frags_data]
+    killer_locations = get_locations(killers_data)
+    vehicle_locations = get_locations(vehicles_data)
+    return OrderedDict((
+        ('time', [x['time'] for x in vehicle_frags_data]),
+        ('damage_type_id', [damage_type_ids[x['damage_type']] for x in vehicle_frags_data]),
+        ('killer_id', [int(x['id']) for x in killers_data]),
+        ('killer_team_index', [x['team'] for x in killers_data]),
+        ('killer_location_x', killer_locations[:, 0].tolist()),
+        ('killer_location_y', killer_locations[:, 1].tolist()),
+        ('killer_location_z', killer_locations[:, 2].tolist()),
+        ('killer_pawn_class_id', [pawn_class_ids[x['pawn']] for x in killers_data]),
+        ('killer_vehicle_class_id', [pawn_class_ids[x['vehicle']] for x in killers_data]),
+        ('vehicle_class_id', [pawn_class_ids[x['vehicle']] for x in vehicles_data]),
+        ('vehicle_team_index', [x['team'] for x in vehicles_data]),
+        ('vehicle_location_x', vehicle_locations[:, 0].tolist()),
+        ('vehicle_location_y', vehicle_locations[:, 1].tolist()),
+        ('vehicle_location_z', vehicle_locations[:, 2].tolist()),
+        ('distance', get_distances(killer_locations, vehicle_locations))
+    ))
+
+
+def build_rows(model, columns, **values):
+    """
+    Builds an instance of `model` for each row of `columns`, with `values` set on all of them.
+    """
+    fields = list(columns.keys())
+    return [model(**dict(zip(fields, row)), **values) for row in zip(*columns.values())]
+
+
+def get_unique_damage_types(round_data):
+    unique_damage_types = set()
+    for frag_data in round_data['frags']:
+        unique_damage_types.add(frag_data['damage_type'])
+    for frag_data in round_data['vehicle_frags']:
+        unique_damage_types.add(frag_data['damage_type'])
+    return unique_damage_types
+
+
+def get_unique_pawn_classes(round_data):
+    unique_pawn_classes = set()
+    for frag_data in round_data['frags']:
+        if frag_data['killer']['pawn'] is not None:
+            unique_pawn_classes.add(frag_data['killer']['pawn'])
+        if frag_data['killer']['vehicle'] is not None:
+            unique_pawn_classes.add(frag_data['killer']['vehicle'])
+        if frag_data['victim']['pawn'] is not None:
+            unique_pawn_classes.add(frag_data['victim']['pawn'])
+    for vehicle_frag_data in round_data['vehicle_frags']:
+        unique_pawn_classes.add(vehicle_frag_data['destroyed_vehicle']['vehicle'])
+        if vehicle_frag_data['killer']['pawn'] is not None:
+            unique_pawn_classes.add(vehicle_frag_data['killer']['pawn'])
+        if vehicle_frag_data['killer']['vehicle'] is not None:
+            unique_pawn_classes.add(vehicle_frag_data['killer']['vehicle'])
+    return unique_pawn_classes
+
+
+def get_unique_construction_classes(round_data):
+    unique_construction_classes = set()
+    for construction_data in round_data['constructions']:
+        unique_construction_classes.add(construction_data['class'])
+    return unique_construction_classes
+
+
+def get_stale_log_job_started_at():
+    """
+    Returns the time before which jobs that are still being worked on must have been abandoned (see `LOG_JOB_TIMEOUT`).
+    """
+    return timezone.now() - datetime.timedelta(seconds=settings.LOG_JOB_TIMEOUT)
+
+
+def claim_log_job(job_id=None):
+    """
+    Marks the oldest queued or abandoned job (or the job with the given id, if it's one of those) as being worked on
+    and returns it, or None if there is nothing to do. Rows are locked with SKIP LOCKED so that any number of workers
+    can drain the queue at once.
+    """
+    with transaction.atomic():
+        jobs = models.LogJob.objects.select_for_update(skip_locked=True).filter(
+            Q(status='queued') |
+            Q(status__in=('parsing', 'ingesting'), started_at__lt=get_stale_log_job_started_at())
+        )
+        if job_id is not None:
+            jobs = jobs.filter(id=job_id)
+        job = jobs.order_by('id').first()
+        if job is None:
+            return None
+        job.status = 'parsing'
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+    return job
+
+
+def store_log_job_payload(job, file):
+    file.seek(0)
+    index = 0
+    while True:
+        data = file.read(LOG_JOB_CHUNK_SIZE)
+        if not data:
+            break
+        models.LogJobChunk.objects.create(job=job, index=index, data=data)
+        index += 1
+
+
+def run_log_job(job):
+    try:
+        with tempfile.TemporaryFile() as file:
+            # Reassemble the upload one chunk at a time, rather than pulling the whole thing into memory at once.
+            for chunk_id in job.chunks.order_by('index').values_list('id', flat=True):
+                file.write(models.LogJobChunk.objects.get(id=chunk_id).data)
+            job.status = 'ingesting'
+            job.save(update_fields=['status'])
+            job.log = ingest_log_file(file, job.crc)
+    except BaseCustomException as e:
+        job.status = 'failed'
+        job.error = e.error_message
+    except Exception as e:
+        logger.exception('Failed to ingest log job %s', job.id)
+        job.status = 'failed'
+        job.error = repr(e)
+    else:
+        # The log is stored on disk once ingested, no need to hold on to a second copy.
+        job.status = 'succeeded'
+        job.chunks.all().delete()
+    job.finished_at = timezone.now()
+    job.save()
+    return job
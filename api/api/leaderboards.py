@@ -0,0 +1,92 @@
+import datetime
+from collections import defaultdict
+
+from django.db.models import ExpressionWrapper, FloatField, Q, Value
+from django.db.models.functions import Cast, Greatest
+from django.utils import timezone
+
+from . import models
+from .db import add_counts
+
+# The stats that players can be ranked by.
+STATS = ('kills', 'kd', 'ff_kills', 'playtime')
+
+# The stats that are added up from each log, rather than worked out from the others.
+FIELDS = ('kills', 'deaths', 'ff_kills', 'playtime')
+
+# The fields that key the entries of each kind of leaderboard, and the condition of its unique constraint, by whether
+# the leaderboard has a map and whether it has a week.
+SCOPES = {
+    (False, False): (('player_id',), Q(map=None, week=None)),
+    (True, False): (('player_id', 'map_id'), Q(week=None)),
+    (False, True): (('player_id', 'week'), Q(map=None)),
+}
+
+
+def get_week(value):
+    """
+    Returns the Monday of the week that `value`, a date or datetime, is in. Weekly leaderboards are keyed by it.
+    """
+    if isinstance(value, datetime.datetime):
+        value = timezone.localtime(value).date()
+    return value - datetime.timedelta(days=value.weekday())
+
+
+def get_kd(kills, deaths):
+    # Players who haven't died are ranked as if they had died once, rather than not at all.
+    return kills / max(deaths, 1)
+
+
+def add_entries(deltas):
+    """
+    Adds each of `deltas`, a dict of (player id, map id, week) to the kills, deaths, ff_kills and playtime to add, onto
+    those leaderboard entries, creating the ones that don't exist yet.
+
+    Callers must make sure nobody else is adding to the same players' entries in the meantime (see `advisory_lock`).
+    """
+    if len(deltas) == 0:
+        return
+    scope_deltas = defaultdict(dict)
+    for (player_id, map_id, week), delta in deltas.items():
+        values = {'player_id': player_id, 'map_id': map_id, 'week': week}
+        scope = (map_id is not None, week is not None)
+        scope_deltas[scope][tuple(values[x] for x in SCOPES[scope][0])] = {x: delta[x] for x in FIELDS}
+    for scope in sorted(scope_deltas.keys()):
+        fields, condition = SCOPES[scope]
+        add_counts(models.LeaderboardEntry, fields, scope_deltas[scope], condition)
+    # Same as `get_kd`.
+    condition = Q()
+    for map_id, week in set(x[1:] for x in deltas.keys()):
+        condition |= Q(map_id=map_id, week=week)
+    models.LeaderboardEntry.objects.filter(condition, player_id__in=set(x[0] for x in deltas.keys())).update(
+        kd=ExpressionWrapper(Cast('kills', FloatField()) / Greatest('deaths', Value(1)), output_field=FloatField())
+    )
+
+
+def get_board(queryset, stat, map_id=None, week=None, min_kills=0):
+    """
+    Returns the entries in `queryset` on the leaderboard of all time, of all time on a map, or of the week starting
+    on `week`, best first.
+    """
+    queryset = queryset.filter(map_id=map_id, week=week)
+    if min_kills > 0:
+        queryset = queryset.filter(kills__gte=min_kills)
+    return queryset.order_by('-' + stat, 'player_id')
+
+
+def get_rank(board, stat, entry):
+    # Players that tie share a rank, and the next player down is ranked as if they hadn't.
+    return board.filter(**{stat + '__gt': getattr(entry, stat)}).count() + 1
+
+
+def rank_entries(board, stat, entries, offset):
+    """
+    Sets the `rank` of each of `entries`, a page of `board` starting `offset` entries in.
+    """
+    for i, entry in enumerate(entries):
+        if i == 0:
+            entry.rank = get_rank(board, stat, entry) if offset > 0 else 1
+        elif getattr(entry, stat) == getattr(entries[i - 1], stat):
+            entry.rank = entries[i - 1].rank
+        else:
+            entry.rank = offset + i + 1
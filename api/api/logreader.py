@@ -0,0 +1,176 @@
+import binascii
+import codecs
+import json
+import re
+from json.decoder import JSONDecodeError
+
+from .timing import NULL_TIMER
+
+CHUNK_SIZE = 64 * 1024
+
+# Everything in a log except for the rounds, all of which are needed before the rounds can be ingested.
+HEADER_KEYS = ('version', 'map', 'players', 'text_messages')
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# The game mangles names with special characters which can cause decoding errors.
+# To mitigate this, let's just replace un-mappable characters with spaces as we
+# encounter them and hope for the best.
+codecs.register_error('log_space', lambda e: (' ', e.end))
+
+
+def log_crc(file):
+    """
+    Returns the CRC of a log file, which is what we use to identify a log. Line breaks are ignored.
+    """
+    file.seek(0)
+    crc = 0
+    while True:
+        data = file.read(CHUNK_SIZE)
+        if not data:
+            break
+        crc = binascii.crc32(data.replace(b'\r', b'').replace(b'\n', b''), crc)
+    return crc
+
+
+class LogReader(object):
+    """
+    Reads a log incrementally from a file.
+
+    The header (everything but the rounds) is small and is read up front with `read_header`, after which
+    `iter_rounds` yields the rounds one at a time. Only one round is ever held in memory, however long the log is.
+    """
+
+    def __init__(self, file, escape_backslashes=False, timer=NULL_TIMER):
+        self.file = file
+        self.escape_backslashes = escape_backslashes
+        self.timer = timer
+        self.decoder = json.JSONDecoder()
+        self._rewind()
+
+    def read_header(self):
+        self._rewind()
+        header = dict()
+        self._members = self._iter_object()
+        for key in self._members:
+            if key == 'rounds':
+                if all(x in header for x in HEADER_KEYS):
+                    # Everything we need comes before the rounds, so they can be read straight from here.
+                    return header
+                # Otherwise skip past them for now and come back for them in `iter_rounds`.
+                for _ in self._iter_array():
+                    pass
+                continue
+            header[key] = self._read_value()
+        self._members = None
+        return header
+
+    def iter_rounds(self):
+        if self._members is None:
+            self._rewind()
+            self._members = self._iter_object()
+            for key in self._members:
+                if key == 'rounds':
+                    break
+                self._read_value()
+            else:
+                return
+        for round_data in self._iter_array():
+            yield round_data
+        # Read the rest of the log to make sure that it's intact.
+        for _ in self._members:
+            self._read_value()
+        self._members = None
+
+    def _rewind(self):
+        self.file.seek(0)
+        self._text_decoder = codecs.getincrementaldecoder('cp1251')(errors='log_space')
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._members = None
+
+    def _fill(self):
+        """
+        Reads more of the file into the buffer, returning False if there's nothing left. Each read is at least as
+        large as what's already buffered, so values that span many reads only need to be retried a few times.
+        """
+        if self._eof:
+            return False
+        with self.timer.phase('decode'):
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+            data = self.file.read(max(CHUNK_SIZE, len(self._buffer)))
+            if not data:
+                self._eof = True
+                self._buffer += self._text_decoder.decode(b'', final=True)
+                return True
+            data = data.replace(b'\r', b'').replace(b'\n', b'')
+            text = self._text_decoder.decode(data)
+            if self.escape_backslashes:
+                # Versions <=v9.0.9 had a bug where backslashes were not being properly escaped.
+                text = text.replace('\\', '\\\\')
+            self._buffer += text
+            return True
+
+    def _peek(self):
+        while True:
+            self._pos = WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise JSONDecodeError('Unexpected end of log', self._buffer, self._pos)
+
+    def _consume(self, char):
+        if self._peek() != char:
+            raise JSONDecodeError('Expecting {!r}'.format(char), self._buffer, self._pos)
+        self._pos += 1
+
+    def _read_value(self):
+        self._peek()
+        while True:
+            try:
+                with self.timer.phase('parse'):
+                    value, end = self.decoder.raw_decode(self._buffer, self._pos)
+            except JSONDecodeError:
+                # The value may just be cut off by the end of the buffer.
+                if self._fill():
+                    continue
+                raise
+            # A number at the very end of the buffer might carry on into the next read.
+            if end == len(self._buffer) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def _iter_object(self):
+        """
+        Yields the keys of the object at the current position. The caller must read each key's value before asking
+        for the next key.
+        """
+        self._consume('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self._read_value()
+            self._consume(':')
+            yield key
+            if self._peek() == ',':
+                self._pos += 1
+            else:
+                self._consume('}')
+                return
+
+    def _iter_array(self):
+        self._consume('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._read_value()
+            if self._peek() == ',':
+                self._pos += 1
+            else:
+                self._consume(']')
+                return
@@ -0,0 +1,45 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from ...benchmark import ingest_rolled_back
+from ...exceptions import BaseCustomException
+from ...logreader import log_crc
+
+
+class Command(BaseCommand):
+    help = 'Times ingesting a log with batched INSERTs and with COPY. The log is rolled back after each run.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('log', help='Path to a log file.')
+        parser.add_argument('--runs', type=int, default=3, help='Number of times to ingest the log with each method.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stderr.write('COPY is only used on PostgreSQL, both methods will INSERT on {}.'.format(connection.vendor))
+
+        with open(options['log'], 'rb') as file:
+            crc = log_crc(file)
+            results = []
+            for method, use_copy in (('insert', False), ('copy', True)):
+                timings = []
+                for _ in range(options['runs']):
+                    with override_settings(INGEST_USE_COPY=use_copy):
+                        started_at = time.perf_counter()
+                        try:
+                            ingest_rolled_back(file, crc)
+                        except BaseCustomException as e:
+                            raise CommandError(e.error_message)
+                        timings.append(time.perf_counter() - started_at)
+                results.append((method, timings))
+
+        for method, timings in results:
+            self.stdout.write('{:<8} median {:.3f}s  min {:.3f}s  max {:.3f}s'.format(
+                method, statistics.median(timings), min(timings), max(timings)
+            ))
+        insert_median = statistics.median(results[0][1])
+        copy_median = statistics.median(results[1][1])
+        self.stdout.write(self.style.SUCCESS('copy/insert: {:.2f}x'.format(insert_median / copy_median)))
@@ -0,0 +1,106 @@
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from ... import models
+from ...benchmark import generate_logs, get_endpoints
+from ...timing import PhaseTimer
+
+
+class Command(BaseCommand):
+    help = 'Measures the latency, queries and response size of every read endpoint, flagging the ones with N+1 queries.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--generate-logs', type=int, default=0,
+                            help='Ingest this many generated logs before measuring. They are kept, so use a scratch database.')
+        parser.add_argument('--players', type=int, default=64, help='Players per generated log.')
+        parser.add_argument('--player-pool', type=int, default=20000, help='Number of distinct players across generated logs.')
+        parser.add_argument('--rounds', type=int, default=3, help='Rounds per generated log.')
+        parser.add_argument('--frags', type=int, default=150, help='Frags per generated round.')
+        parser.add_argument('--requests', type=int, default=20, help='Number of timed requests per endpoint.')
+        parser.add_argument('--prefix', action='append', help='Only measure endpoints under these prefixes.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+
+    def handle(self, *args, **options):
+        for i in generate_logs(options['generate_logs'], players=options['players'], player_pool=options['player_pool'],
+                               rounds=options['rounds'], frags=options['frags']):
+            if i % 100 == 0:
+                self.stdout.write('Generated {}/{} logs'.format(i, options['generate_logs']))
+
+        client = Client()
+        results = []
+        for name, path, params in get_endpoints(options['prefix']):
+            result = self.measure(client, path, params, options['requests'])
+            result['endpoint'] = name
+            results.append(result)
+            self.stdout.write('{} {}'.format(name, 'done' if 'error' not in result else result['error']))
+
+        self.stdout.write('')
+        self.stdout.write('{:<44}{:>7}{:>9}{:>9}{:>9}{:>10}{:>10}{:>10}  {}'.format(
+            'endpoint', 'status', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'q(5)', 'bytes', 'N+1'
+        ))
+        for result in results:
+            if 'error' in result:
+                self.stdout.write('{:<44}{:>7}  {}'.format(result['endpoint'], 'error', result['error']))
+                continue
+            line = '{:<44}{:>7}{:>9.1f}{:>9.1f}{:>9.1f}{:>10}{:>10}{:>10}  {}'.format(
+                result['endpoint'], result['status'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                result['queries'], result['queries_limit_5'], result['bytes'], 'yes' if result['n_plus_one'] else ''
+            )
+            self.stdout.write(self.style.WARNING(line) if result['n_plus_one'] else line)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'database': connection.vendor,
+                    'counts': {
+                        'players': models.Player.objects.count(),
+                        'player_names': models.PlayerName.objects.count(),
+                        'logs': models.Log.objects.count(),
+                        'rounds': models.Round.objects.count(),
+                        'frags': models.Frag.objects.count(),
+                        'text_messages': models.TextMessage.objects.count()
+                    },
+                    'results': results
+                }, f, indent=2)
+
+    # Measure the work behind the responses, rather than how quickly they come out of the cache.
+    @override_settings(RESPONSE_CACHE_ENABLED=False)
+    def measure(self, client, path, params, count):
+        """
+        Requests `path` `count` times with a page of 25, and once more with a page of 5. Endpoints that run more queries
+        for the bigger page are running queries per row.
+        """
+        try:
+            timer = PhaseTimer()
+            with timer.count_queries():
+                with timer.phase('limit_5'):
+                    client.get(path, dict(params, limit=5))
+                with timer.phase('limit_25'):
+                    response = client.get(path, dict(params, limit=25))
+            timings = []
+            for _ in range(count):
+                started_at = time.perf_counter()
+                client.get(path, dict(params, limit=25))
+                timings.append((time.perf_counter() - started_at) * 1000)
+        except Exception as e:
+            return {'path': path, 'error': '{}: {}'.format(type(e).__name__, e)}
+        p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+        queries = timer.phases['limit_25']['queries']
+        small_page_queries = timer.phases['limit_5']['queries']
+        return {
+            'path': path,
+            'params': params,
+            'status': response.status_code,
+            'p50_ms': p50,
+            'p95_ms': p95,
+            'p99_ms': p99,
+            'queries': queries,
+            'queries_limit_5': small_page_queries,
+            'bytes': len(response.content),
+            'n_plus_one': queries > small_page_queries
+        }
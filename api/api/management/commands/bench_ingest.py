@@ -0,0 +1,90 @@
+import json
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from ...benchmark import generate_log, ingest_rolled_back, write_log
+from ...exceptions import BaseCustomException
+from ...logreader import log_crc
+from ...timing import PhaseTimer
+
+
+class Command(BaseCommand):
+    help = 'Times each phase of ingesting a generated log. The log is rolled back after each run.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=64)
+        parser.add_argument('--rounds', type=int, default=3)
+        parser.add_argument('--frags', type=int, default=500, help='Frags per round.')
+        parser.add_argument('--vehicle-frags', type=int, default=10, help='Vehicle frags per round.')
+        parser.add_argument('--rally-points', type=int, default=20, help='Rally points per round.')
+        parser.add_argument('--constructions', type=int, default=30, help='Constructions per round.')
+        parser.add_argument('--events', type=int, default=5, help='Events per round.')
+        parser.add_argument('--text-messages', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--runs', type=int, default=3, help='Number of times to ingest the log.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--save-log', help='Also write the generated log to this file.')
+
+    def handle(self, *args, **options):
+        parameters = {x: options[x] for x in ('players', 'rounds', 'frags', 'vehicle_frags', 'rally_points',
+                                              'constructions', 'events', 'text_messages', 'seed')}
+        log = generate_log(**parameters)
+
+        runs = []
+        with tempfile.TemporaryFile() as file:
+            write_log(log, file)
+            log_bytes = file.tell()
+            if options['save_log']:
+                file.seek(0)
+                with open(options['save_log'], 'wb') as f:
+                    f.write(file.read())
+            crc = log_crc(file)
+
+            for i in range(options['runs']):
+                timer = PhaseTimer()
+                started_at = time.perf_counter()
+                with timer.count_queries():
+                    try:
+                        ingest_rolled_back(file, crc, timer)
+                    except BaseCustomException as e:
+                        raise CommandError(e.error_message)
+                runs.append({
+                    'seconds': time.perf_counter() - started_at,
+                    'queries': sum(x['queries'] for x in timer.phases.values()),
+                    'phases': timer.phases
+                })
+                self.stdout.write('run {}: {:.3f}s, {} queries'.format(i + 1, runs[-1]['seconds'], runs[-1]['queries']))
+
+        phase_names = []
+        for run in runs:
+            phase_names.extend(x for x in run['phases'] if x not in phase_names)
+        median = {
+            'seconds': statistics.median(x['seconds'] for x in runs),
+            'queries': statistics.median(x['queries'] for x in runs),
+            'phases': {name: {
+                'seconds': statistics.median(x['phases'].get(name, {}).get('seconds', 0.0) for x in runs),
+                'queries': statistics.median(x['phases'].get(name, {}).get('queries', 0) for x in runs)
+            } for name in phase_names}
+        }
+
+        self.stdout.write('{:<24}{:>10}{:>10}'.format('phase', 'seconds', 'queries'))
+        for name in phase_names:
+            self.stdout.write('{:<24}{:>10.3f}{:>10.0f}'.format(name, median['phases'][name]['seconds'], median['phases'][name]['queries']))
+        self.stdout.write(self.style.SUCCESS('{:<24}{:>10.3f}{:>10.0f}'.format('total', median['seconds'], median['queries'])))
+
+        if options['output']:
+            results = {
+                'created_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'parameters': parameters,
+                'log_bytes': log_bytes,
+                'runs': runs,
+                'median': median
+            }
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
@@ -0,0 +1,115 @@
+import json
+import re
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from ...benchmark import generate_logs, get_endpoints
+
+# SQLite describes a full table scan as "SCAN <table>" (or "SCAN TABLE <table>" before 3.36), and a scan that walks an
+# index as "SCAN <table> USING INDEX <index>".
+SQLITE_SCAN_PATTERN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+
+FROM_PATTERN = re.compile(r' FROM "?(\w+)"?')
+
+
+def get_early_stopping_table(sql):
+    """
+    Returns the table that `sql` selects from if it only wants the first few rows it comes across, in which case
+    scanning that table is fine.
+    """
+    upper_sql = sql.upper()
+    if ' LIMIT ' not in upper_sql or any(x in upper_sql for x in (' WHERE ', ' ORDER BY ', ' GROUP BY ')):
+        return None
+    match = FROM_PATTERN.search(sql)
+    return match.group(1) if match else None
+
+
+def get_sequential_scans(sql, params):
+    """
+    Returns the names of the tables that the database would read from start to finish to run `sql`.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plans = [cursor.fetchone()[0][0]['Plan']]
+            tables = []
+            while plans:
+                plan = plans.pop()
+                if plan['Node Type'] == 'Seq Scan':
+                    tables.append(plan['Relation Name'])
+                plans.extend(plan.get('Plans', []))
+            return tables
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        tables = []
+        for row in cursor.fetchall():
+            match = SQLITE_SCAN_PATTERN.match(row[-1])
+            if match:
+                tables.append(match.group(1))
+        return tables
+
+
+class Command(BaseCommand):
+    help = 'Explains the queries that every read endpoint runs, flagging the ones that scan a whole table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--generate-logs', type=int, default=0,
+                            help='Ingest this many generated logs first. They are kept, so use a scratch database.')
+        parser.add_argument('--players', type=int, default=64, help='Players per generated log.')
+        parser.add_argument('--player-pool', type=int, default=20000, help='Number of distinct players across generated logs.')
+        parser.add_argument('--rounds', type=int, default=3, help='Rounds per generated log.')
+        parser.add_argument('--frags', type=int, default=150, help='Frags per generated round.')
+        parser.add_argument('--min-rows', type=int, default=1000,
+                            help='Ignore scans of tables with fewer rows than this, which are quicker to scan anyway.')
+        parser.add_argument('--prefix', action='append', help='Only explain endpoints under these prefixes.')
+        parser.add_argument('--output', help='Write the flagged queries as JSON to this file.')
+
+    def handle(self, *args, **options):
+        for i in generate_logs(options['generate_logs'], players=options['players'], player_pool=options['player_pool'],
+                               rounds=options['rounds'], frags=options['frags']):
+            if i % 100 == 0:
+                self.stdout.write('Generated {}/{} logs'.format(i, options['generate_logs']))
+
+        table_rows = dict()
+        with connection.cursor() as cursor:
+            for table in connection.introspection.table_names(cursor):
+                cursor.execute('SELECT COUNT(*) FROM {}'.format(connection.ops.quote_name(table)))
+                table_rows[table] = cursor.fetchone()[0]
+
+        client = Client()
+        results = []
+        for name, path, params in get_endpoints(options['prefix']):
+            queries = []
+
+            def record(execute, sql, query_params, many, context):
+                if sql.lstrip().upper().startswith('SELECT'):
+                    queries.append((sql, query_params))
+                return execute(sql, query_params, many, context)
+
+            with connection.execute_wrapper(record), override_settings(RESPONSE_CACHE_ENABLED=False):
+                client.get(path, params)
+
+            explained = set()
+            for sql, query_params in queries:
+                if sql in explained:
+                    continue
+                explained.add(sql)
+                early_stopping_table = get_early_stopping_table(sql)
+                tables = [x for x in get_sequential_scans(sql, query_params)
+                          if table_rows.get(x, 0) >= options['min_rows'] and x != early_stopping_table]
+                if tables:
+                    results.append({'endpoint': name, 'path': path, 'tables': tables, 'sql': sql})
+                    self.stdout.write(self.style.WARNING('{}: scans {}'.format(name, ', '.join(tables))))
+                    self.stdout.write('    {}'.format(sql))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'database': connection.vendor, 'table_rows': table_rows, 'results': results}, f, indent=2)
+
+        endpoints = len(set(x['endpoint'] for x in results))
+        if endpoints > 0:
+            self.stdout.write(self.style.WARNING('{} queries on {} endpoints scan whole tables'.format(len(results), endpoints)))
+        else:
+            self.stdout.write(self.style.SUCCESS('No endpoint scans a whole table'))
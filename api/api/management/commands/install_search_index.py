@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from ...search import drop_index, install_index
+
+
+class Command(BaseCommand):
+    help = 'Creates the indexes that text message and player searches use.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drop', action='store_true', help='Drop the index instead.')
+
+    def handle(self, *args, **options):
+        if options['drop']:
+            drop_index()
+            self.stdout.write(self.style.SUCCESS('Dropped the search index'))
+            return
+        self.stdout.write('Indexing text messages, this can take a while on a big database')
+        if not install_index():
+            raise CommandError('Full-text search is not supported on {}'.format(connection.vendor))
+        self.stdout.write(self.style.SUCCESS('Installed the search index'))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...ingest import claim_log_job, run_log_job
+
+
+class Command(BaseCommand):
+    help = 'Drains the queue of uploaded logs waiting to be ingested.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty instead of polling.')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to wait between polls of an empty queue.')
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_log_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+                continue
+            job = run_log_job(job)
+            self.stdout.write('Job {} {} ({})'.format(job.id, job.status, job.crc))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...caching import invalidate_all
+from ...models import DamageTypeSummary, Round
+from ...stats import calculate_damage_type_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recalculates the kills, team kills and suicides of every damage type in every round from its frags.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Number of rounds to recalculate at a time.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        round_ids = list(Round.objects.order_by('id').values_list('id', flat=True))
+
+        self.stdout.write('Recalculating damage type summaries for {} rounds'.format(len(round_ids)))
+
+        started_at = time.time()
+        for i in range(0, len(round_ids), chunk_size):
+            chunk = round_ids[i:i + chunk_size]
+            summaries = calculate_damage_type_summaries(chunk)
+            with transaction.atomic():
+                DamageTypeSummary.objects.filter(round_id__in=chunk).delete()
+                DamageTypeSummary.objects.bulk_create(summaries)
+            self.stdout.write('{}/{} rounds'.format(i + len(chunk), len(round_ids)))
+
+        invalidate_all()
+        self.stdout.write(self.style.SUCCESS('Recalculated damage type summaries for {} rounds in {:.1f}s'.format(len(round_ids), time.time() - started_at)))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...caching import invalidate_all
+from ...heatmap import rebuild_cells
+from ...models import Map
+
+
+class Command(BaseCommand):
+    help = 'Recounts the heatmap cells of every map (or just the given maps) from their frags.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('maps', nargs='*', help='Names of the maps to rebuild.')
+
+    def handle(self, *args, **options):
+        maps = Map.objects.order_by('name')
+        if options['maps']:
+            maps = maps.filter(name__in=options['maps'])
+        for map in maps:
+            started_at = time.time()
+            with transaction.atomic():
+                cell_count = rebuild_cells(map)
+            self.stdout.write('{}: {} cells in {:.1f}s'.format(map.name, cell_count, time.time() - started_at))
+        invalidate_all()
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...caching import invalidate_all
+from ...db import advisory_lock, bulk_insert
+from ...leaderboards import get_kd
+from ...models import LeaderboardEntry, Player
+from ...stats import calculate_leaderboard_entries
+
+
+def rebuild_leaderboards(player_ids):
+    with transaction.atomic():
+        # Logs ingested in the meantime would otherwise add onto entries that are about to be replaced.
+        advisory_lock('player', *player_ids)
+        entries = calculate_leaderboard_entries(player_ids[0], player_ids[-1])
+        existing = LeaderboardEntry.objects.filter(player_id__gte=player_ids[0], player_id__lte=player_ids[-1])
+        # Playtime on each map can't be worked out again afterwards, so keep what was counted at ingest.
+        for player_id, map_id, playtime in existing.filter(map__isnull=False, week=None)\
+                .values_list('player_id', 'map_id', 'playtime'):
+            entries[(player_id, map_id, None)]['playtime'] = playtime
+        rows = []
+        for (player_id, map_id, week), stats in entries.items():
+            rows.append(LeaderboardEntry(player_id=player_id, map_id=map_id, week=week,
+                                         kd=get_kd(stats['kills'], stats['deaths']), **stats))
+        existing.delete()
+        bulk_insert(LeaderboardEntry, rows)
+    return len(rows)
+
+
+class Command(BaseCommand):
+    help = 'Recalculates every leaderboard entry from the frags and sessions of each player.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Number of players to recalculate at a time.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        player_ids = list(Player.objects.order_by('id').values_list('id', flat=True))
+
+        self.stdout.write('Recalculating leaderboards for {} players'.format(len(player_ids)))
+
+        started_at = time.time()
+        count = 0
+        for i in range(0, len(player_ids), chunk_size):
+            chunk = player_ids[i:i + chunk_size]
+            count += rebuild_leaderboards(chunk)
+            self.stdout.write('{}/{} players'.format(i + len(chunk), len(player_ids)))
+
+        invalidate_all()
+        self.stdout.write(self.style.SUCCESS('Recalculated {} leaderboard entries in {:.1f}s'.format(count, time.time() - started_at)))
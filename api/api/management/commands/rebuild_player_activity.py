@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...caching import invalidate_all
+from ...db import advisory_lock, bulk_insert
+from ...models import Player, PlayerActivity
+from ...stats import calculate_player_activity
+
+
+class Command(BaseCommand):
+    help = 'Recalculates the playtime and number of sessions of every player on each day from their sessions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Number of players to recalculate at a time.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        player_ids = list(Player.objects.order_by('id').values_list('id', flat=True))
+
+        self.stdout.write('Recalculating activity for {} players'.format(len(player_ids)))
+
+        started_at = time.time()
+        for i in range(0, len(player_ids), chunk_size):
+            chunk = player_ids[i:i + chunk_size]
+            with transaction.atomic():
+                # Logs ingested in the meantime would otherwise add onto days that are about to be replaced.
+                advisory_lock('player', *chunk)
+                days = calculate_player_activity(chunk[0], chunk[-1])
+                PlayerActivity.objects.filter(player_id__gte=chunk[0], player_id__lte=chunk[-1]).delete()
+                bulk_insert(PlayerActivity, days)
+            self.stdout.write('{}/{} players'.format(i + len(chunk), len(player_ids)))
+
+        invalidate_all()
+        self.stdout.write(self.style.SUCCESS('Recalculated activity for {} players in {:.1f}s'.format(len(player_ids), time.time() - started_at)))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from ...caching import invalidate_all
+from ...models import Player
+
+
+class Command(BaseCommand):
+    help = 'Sets the name of every player to the last name they were seen with.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Number of players to update at a time.')
+        parser.add_argument('--missing', action='store_true', help='Only set the names of players without one.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        players = Player.objects.order_by('id')
+        if options['missing']:
+            players = players.filter(name__isnull=True)
+        player_ids = list(players.values_list('id', flat=True))
+
+        # Names are only recorded the first time a player is seen with them, so the latest of those will have to do.
+        last_name = Player.names.through.objects.filter(player_id=OuterRef('pk')).order_by('-id').values('playername__name')[:1]
+
+        started_at = time.time()
+        for i in range(0, len(player_ids), chunk_size):
+            chunk = player_ids[i:i + chunk_size]
+            with transaction.atomic():
+                Player.objects.filter(id__in=chunk).update(name=Subquery(last_name))
+            self.stdout.write('{}/{} players'.format(i + len(chunk), len(player_ids)))
+
+        invalidate_all()
+        self.stdout.write(self.style.SUCCESS('Set the names of {} players in {:.1f}s'.format(len(player_ids), time.time() - started_at)))
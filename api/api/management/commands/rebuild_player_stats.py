@@ -0,0 +1,60 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from ...caching import invalidate_all
+from ...db import advisory_lock
+from ...models import Player
+from ...stats import calculate_player_stats
+
+
+def rebuild_player_stats(player_ids):
+    with transaction.atomic():
+        # Logs ingested in the meantime would otherwise add onto stats that are about to be overwritten.
+        advisory_lock('player', *player_ids)
+        stats = calculate_player_stats(player_ids[0], player_ids[-1])
+        players = []
+        for player_id, player_stats in stats.items():
+            players.append(Player(id=player_id, **player_stats))
+        Player.objects.bulk_update(players, ['kills', 'deaths', 'ff_kills', 'ff_deaths', 'playtime'], batch_size=500)
+    return len(players)
+
+
+class Command(BaseCommand):
+    help = 'Recalculates the aggregate stats of every player from scratch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of processes to split the players across.')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Number of players to recalculate at a time.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        player_ids = list(Player.objects.order_by('id').values_list('id', flat=True))
+        chunks = [player_ids[i:i + chunk_size] for i in range(0, len(player_ids), chunk_size)]
+
+        self.stdout.write('Recalculating stats for {} players in {} chunks'.format(len(player_ids), len(chunks)))
+
+        started_at = time.time()
+        if options['workers'] > 1:
+            # Forked workers must not share the parent's database connection.
+            connections.close_all()
+            pool = multiprocessing.Pool(options['workers'])
+            results = pool.imap_unordered(rebuild_player_stats, chunks)
+        else:
+            pool = None
+            results = map(rebuild_player_stats, chunks)
+
+        count = 0
+        for chunk_count in results:
+            count += chunk_count
+            elapsed = time.time() - started_at
+            self.stdout.write('{}/{} players ({:.0f} players/s)'.format(count, len(player_ids), count / elapsed if elapsed > 0 else 0))
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        invalidate_all()
+        self.stdout.write(self.style.SUCCESS('Recalculated stats for {} players in {:.1f}s'.format(count, time.time() - started_at)))
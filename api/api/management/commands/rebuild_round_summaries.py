@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...caching import invalidate_all
+from ...models import Round, RoundSummary
+from ...stats import calculate_round_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recalculates the summary of every round from its frags.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Number of rounds to recalculate at a time.')
+        parser.add_argument('--missing', action='store_true', help='Only calculate summaries for rounds without one.')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        rounds = Round.objects.order_by('id')
+        if options['missing']:
+            rounds = rounds.filter(summary__isnull=True)
+        round_ids = list(rounds.values_list('id', flat=True))
+
+        self.stdout.write('Recalculating summaries for {} rounds'.format(len(round_ids)))
+
+        started_at = time.time()
+        for i in range(0, len(round_ids), chunk_size):
+            chunk = round_ids[i:i + chunk_size]
+            summaries = calculate_round_summaries(chunk)
+            with transaction.atomic():
+                RoundSummary.objects.filter(round_id__in=chunk).delete()
+                RoundSummary.objects.bulk_create(summaries)
+            self.stdout.write('{}/{} rounds'.format(i + len(chunk), len(round_ids)))
+
+        invalidate_all()
+        self.stdout.write(self.style.SUCCESS('Recalculated summaries for {} rounds in {:.1f}s'.format(len(round_ids), time.time() - started_at)))
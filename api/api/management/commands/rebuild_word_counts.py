@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...caching import invalidate_all
+from ...models import Log
+from ...words import rebuild_word_counts
+
+
+class Command(BaseCommand):
+    help = 'Recounts the words used in the text messages of every log.'
+
+    def handle(self, *args, **options):
+        logs = Log.objects.order_by('id')
+        log_count = logs.count()
+        started_at = time.time()
+        for i, log in enumerate(logs.iterator()):
+            with transaction.atomic():
+                rebuild_word_counts(log)
+            if (i + 1) % 100 == 0:
+                self.stdout.write('{}/{} logs'.format(i + 1, log_count))
+        invalidate_all()
+        self.stdout.write(self.style.SUCCESS('Recounted words for {} logs in {:.1f}s'.format(log_count, time.time() - started_at)))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from ...caching import get_metrics, invalidate_all, reset_metrics
+
+
+class Command(BaseCommand):
+    help = 'Reports the hits and misses of each cached endpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the hit and miss counts afterwards.')
+        parser.add_argument('--clear', action='store_true', help='Drop every cached response.')
+
+    def handle(self, *args, **options):
+        metrics = get_metrics()
+        self.stdout.write('{:<32}{:>10}{:>10}{:>10}'.format('endpoint', 'hits', 'misses', 'hit rate'))
+        for endpoint, counts in sorted(metrics.items()):
+            total = counts['hits'] + counts['misses']
+            self.stdout.write('{:<32}{:>10}{:>10}{:>10}'.format(
+                endpoint, counts['hits'], counts['misses'], '{:.1%}'.format(counts['hits'] / total) if total else '-'
+            ))
+        if options['reset']:
+            reset_metrics()
+            self.stdout.write(self.style.SUCCESS('Reset the metrics'))
+        if options['clear']:
+            invalidate_all()
+            self.stdout.write(self.style.SUCCESS('Cleared the response cache'))
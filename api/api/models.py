@@ -1,6 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models import F
+from django.db.models import F, Q
 import datetime
 import isodate
 
@@ -24,6 +24,8 @@ class Session(models.Model):
 
 class Player(models.Model):
     id = models.BigIntegerField(primary_key=True)
+    # The name the player last went by. Every name they've used is in `names`.
+    name = models.CharField(max_length=128, null=True, db_index=True)
     names = models.ManyToManyField(PlayerName)
     sessions = models.ManyToManyField(Session)
     kills = models.PositiveIntegerField(default=0)
@@ -33,11 +35,7 @@ class Player(models.Model):
     playtime = models.DurationField(default=datetime.timedelta())
 
     def __str__(self):
-        return '{} ({})'.format(self.id, self.name)
-
-    @property
-    def name(self):
-        return self.names.all()[0].name if len(self.names.all()) > 0 else 'Unknown'
+        return '{} ({})'.format(self.id, self.name or 'Unknown')
 
     @property
     def ips(self):
@@ -87,8 +85,35 @@ class Log(models.Model):
     players = models.ManyToManyField(Player)
 
 
+class LogJob(models.Model):
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('parsing', 'Parsing'),
+        ('ingesting', 'Ingesting'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed')
+    )
+
+    crc = models.BigIntegerField(db_index=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='queued', db_index=True)
+    error = models.TextField(null=True)
+    log = models.ForeignKey(Log, on_delete=models.SET_NULL, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+
+class LogJobChunk(models.Model):
+    job = models.ForeignKey(LogJob, on_delete=models.CASCADE, related_name='chunks')
+    index = models.IntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        unique_together = ('job', 'index')
+
+
 class Round(models.Model):
-    started_at = models.DateTimeField()
+    started_at = models.DateTimeField(db_index=True)
     ended_at = models.DateTimeField(null=True)
     winner = models.IntegerField(null=True)
     log = models.ForeignKey(Log, on_delete=models.CASCADE)
@@ -118,6 +143,16 @@ class Round(models.Model):
         return self.num_players > 1 and self.num_kills > 0
 
 
+class RoundSummary(models.Model):
+    round = models.OneToOneField(Round, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    kills = models.PositiveIntegerField(default=0)
+    axis_deaths = models.PositiveIntegerField(default=0)
+    allied_deaths = models.PositiveIntegerField(default=0)
+    num_players = models.PositiveIntegerField(default=0)
+    duration = models.DurationField(null=True)
+    is_interesting = models.BooleanField(default=False)
+
+
 class PawnClass(models.Model):
     classname = models.CharField(max_length=128, unique=True)
 
@@ -178,6 +213,52 @@ class Frag(models.Model):
     def is_friendly_fire(self):
         return not self.is_suicide and self.killer_team_index == self.victim_team_index
 
+    class Meta:
+        indexes = [
+            # Round frag listings filtered by killer or victim.
+            models.Index(fields=['round', 'killer'], name='api_frag_round_killer_idx'),
+            models.Index(fields=['round', 'victim'], name='api_frag_round_victim_idx'),
+            # Range histograms.
+            models.Index(fields=['damage_type', 'distance'], name='api_frag_damage_distance_idx'),
+            # Player stats, which split kills into friendly fire and not.
+            models.Index(fields=['killer', 'killer_team_index', 'victim_team_index'], name='api_frag_killer_teams_idx'),
+        ]
+
+
+class HeatmapCell(models.Model):
+    """
+    The number of frags whose victims were in one cell of a map's heatmap grid at the finest zoom level, in rounds that
+    started in a given week (starting on the Monday). See `heatmap`.
+    """
+    map = models.ForeignKey(Map, on_delete=models.CASCADE)
+    week = models.DateField()
+    team_index = models.SmallIntegerField()
+    damage_type = models.ForeignKey(DamageTypeClass, on_delete=models.CASCADE, related_name='+')
+    x = models.IntegerField()
+    y = models.IntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('map', 'week', 'team_index', 'damage_type', 'x', 'y')
+
+
+class DamageTypeSummary(models.Model):
+    """
+    The number of kills, team kills and suicides with one damage type in a round, along with the map, version and start
+    of the round so that the friendly fire report can be filtered without joining anything.
+    """
+    round = models.ForeignKey(Round, on_delete=models.CASCADE, related_name='+')
+    map = models.ForeignKey(Map, on_delete=models.CASCADE, related_name='+')
+    version = models.CharField(max_length=16)
+    started_at = models.DateTimeField()
+    damage_type = models.ForeignKey(DamageTypeClass, on_delete=models.CASCADE, related_name='+')
+    kills = models.PositiveIntegerField(default=0)
+    team_kills = models.PositiveIntegerField(default=0)
+    suicides = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('round', 'damage_type')
+
 
 class VehicleFrag(models.Model):
     round = models.ForeignKey(Round, on_delete=models.CASCADE)
@@ -239,7 +320,7 @@ class RallyPoint(models.Model):
     @property
     def lifespan(self):
         lifespan = datetime.timedelta()
-        destroyed_at = self.destroyed_at or self.round.end_time
+        destroyed_at = self.destroyed_at or self.round.ended_at
         if destroyed_at is not None:
             lifespan = destroyed_at - self.created_at
         return isodate.duration_isoformat(lifespan)
@@ -272,7 +353,7 @@ class Patron(models.Model):
 
 
 class Event(models.Model):
-    type = models.CharField(max_length=32)
+    type = models.CharField(max_length=32, db_index=True)
     data = models.TextField()
     round = models.ForeignKey(Round, on_delete=models.CASCADE, editable=False)
 
@@ -293,13 +374,91 @@ class TextMessage(models.Model):
     sender = models.ForeignKey(Player, on_delete=models.CASCADE)
     message = models.CharField(max_length=128)
     type = models.CharField(max_length=16)
-    sent_at = models.DateTimeField()
+    sent_at = models.DateTimeField(db_index=True)
     team_index = models.SmallIntegerField()
     squad_index = models.SmallIntegerField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['log', 'team_index'], name='api_textmessage_log_team_idx'),
+        ]
+
+
+class WordCount(models.Model):
+    """
+    The number of times a word was used in a log's text messages of one type, by one team.
+    """
+    log = models.ForeignKey(Log, on_delete=models.CASCADE)
+    map = models.ForeignKey(Map, on_delete=models.CASCADE, related_name='+')
+    team_index = models.SmallIntegerField()
+    type = models.CharField(max_length=16)
+    word = models.CharField(max_length=128)
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            # Word clouds add up the counts of each word, which can be read in order of word straight from here.
+            models.Index(fields=['word', 'count'], name='api_wordcount_word_idx'),
+        ]
+
+
+class PlayerActivity(models.Model):
+    """
+    The playtime and number of sessions of a player on one day, by when the sessions started (in UTC).
+    """
+    player = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='+')
+    date = models.DateField()
+    playtime = models.DurationField(default=datetime.timedelta())
+    session_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('player', 'date')
+
+
+class LeaderboardEntry(models.Model):
+    """
+    A player's totals on one leaderboard: of all time (no map or week), of a week (starting on the Monday), or of all
+    time on a map. See `leaderboards`.
+    """
+    player = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='+')
+    map = models.ForeignKey(Map, on_delete=models.CASCADE, null=True, related_name='+')
+    week = models.DateField(null=True)
+    kills = models.PositiveIntegerField(default=0)
+    deaths = models.PositiveIntegerField(default=0)
+    kd = models.FloatField(default=0.0)
+    ff_kills = models.PositiveIntegerField(default=0)
+    playtime = models.DurationField(default=datetime.timedelta())
+
+    class Meta:
+        # A plain unique constraint across the nullable map and week would never match (NULLs are never equal), so
+        # each kind of leaderboard gets its own.
+        constraints = [
+            models.UniqueConstraint(fields=['player'], condition=Q(map=None, week=None),
+                                    name='api_leaderboard_all_time_unique'),
+            models.UniqueConstraint(fields=['player', 'map'], condition=Q(week=None), name='api_leaderboard_map_unique'),
+            models.UniqueConstraint(fields=['player', 'week'], condition=Q(map=None), name='api_leaderboard_week_unique'),
+        ]
+        # Each leaderboard is read top down, and a player's rank is the number of entries above theirs.
+        indexes = [
+            models.Index(fields=['map', 'week', '-kills', 'player'], name='api_leaderboard_kills_idx'),
+            models.Index(fields=['map', 'week', '-kd', 'player'], name='api_leaderboard_kd_idx'),
+            models.Index(fields=['map', 'week', '-ff_kills', 'player'], name='api_leaderboard_ff_kills_idx'),
+            models.Index(fields=['map', 'week', '-playtime', 'player'], name='api_leaderboard_playtime_idx'),
+        ]
+
 
 class Report(models.Model):
     author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     offender = models.ForeignKey(Player, on_delete=models.CASCADE)
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+
+
+class CacheGeneration(models.Model):
+    """
+    How many times the data of an entity (every log, or a map, round or player) has changed. Cached responses are keyed
+    by the generations of the entities they depend on. See `caching`.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    generation = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
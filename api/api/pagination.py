@@ -0,0 +1,83 @@
+from collections import OrderedDict
+
+from django.db import connections
+from rest_framework import pagination
+
+
+def estimate_count(queryset):
+    """
+    Returns the query planner's estimate of the number of rows in `queryset`. This is far quicker than counting them on
+    big tables, but can be well off. Only Postgres keeps statistics to estimate from, so elsewhere the rows are counted.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.get_compiler(queryset.db).as_sql()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    return plan[0]['Plan']['Plan Rows']
+
+
+class CursorPagination(pagination.CursorPagination):
+    """
+    Pages through the rows in the order of the view's `cursor_ordering`, which should be an indexed column.
+    """
+    page_size_query_param = 'limit'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = view.cursor_ordering
+        if ordering.lstrip('-') in ('id', 'pk'):
+            return (ordering,)
+        # Cursors only record the first column, and rows that tie on it are skipped by an offset, so they need to come
+        # back in the same order every time.
+        return (ordering, '-id' if ordering.startswith('-') else 'id')
+
+
+class OptionalCursorPagination(pagination.LimitOffsetPagination):
+    """
+    Pages with `limit` and `offset` like the default pagination, unless a `cursor` is given (an empty one for the first
+    page). Cursors pick up where the last page left off, so deep pages cost as little as the first one, but they only
+    give links to the next and previous pages, without a count.
+
+    With `count=estimate`, the exact count is swapped for an estimate (see `estimate_count`).
+    """
+    cursor_pagination = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.estimate_count = request.query_params.get('count') == 'estimate'
+        if CursorPagination.cursor_query_param in request.query_params:
+            self.cursor_pagination = CursorPagination()
+            self.count = estimate_count(queryset) if self.estimate_count else None
+            return self.cursor_pagination.paginate_queryset(queryset, request, view)
+        if not self.estimate_count:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        self.request = request
+        # Unlike an exact count, the estimate can't tell us whether the page is past the end, so fetch it regardless.
+        results = list(queryset[self.offset:self.offset + self.limit])
+        if len(results) < self.limit:
+            self.count = self.offset + len(results)
+        else:
+            # There may be more rows after a full page whatever the estimate says, so make sure there's a next link.
+            self.count = max(estimate_count(queryset), self.offset + len(results) + 1)
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+        return results
+
+    def get_paginated_response(self, data):
+        if self.cursor_pagination is None:
+            return super().get_paginated_response(data)
+        response = self.cursor_pagination.get_paginated_response(data)
+        if self.count is not None:
+            response.data = OrderedDict([('count', self.count)] + list(response.data.items()))
+        return response
+
+    def to_html(self):
+        if self.cursor_pagination is None:
+            return super().to_html()
+        return self.cursor_pagination.to_html()
@@ -0,0 +1,131 @@
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+
+SEARCH_MODES = ('plain', 'phrase', 'prefix')
+
+# On Postgres, messages are searched through a GIN index on this expression. It has to be written exactly the way
+# Django writes `SearchVector('message', config='simple')`, otherwise the planner won't use the index.
+# Player names are looked up by `name__istartswith`, which needs an index on the same expression Django compares.
+POSTGRES_INDEX_NAMES = ['api_textmessage_message_search', 'api_player_name_upper']
+POSTGRES_INDEX_SQL = [
+    '''CREATE INDEX CONCURRENTLY IF NOT EXISTS api_textmessage_message_search ON api_textmessage
+    USING gin (to_tsvector('simple'::regconfig, COALESCE(message, '')))''',
+    '''CREATE INDEX CONCURRENTLY IF NOT EXISTS api_player_name_upper ON api_player
+    (UPPER(name::text) text_pattern_ops)'''
+]
+
+# SQLite has no such index, so an FTS5 table of the messages is kept in step with triggers instead.
+SQLITE_FTS_TABLE = 'api_textmessage_fts'
+SQLITE_INDEX_SQL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS api_textmessage_fts USING fts5(message, content='api_textmessage', content_rowid='id')",
+    '''CREATE TRIGGER IF NOT EXISTS api_textmessage_fts_insert AFTER INSERT ON api_textmessage BEGIN
+        INSERT INTO api_textmessage_fts (rowid, message) VALUES (new.id, new.message);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS api_textmessage_fts_delete AFTER DELETE ON api_textmessage BEGIN
+        INSERT INTO api_textmessage_fts (api_textmessage_fts, rowid, message) VALUES ('delete', old.id, old.message);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS api_textmessage_fts_update AFTER UPDATE ON api_textmessage BEGIN
+        INSERT INTO api_textmessage_fts (api_textmessage_fts, rowid, message) VALUES ('delete', old.id, old.message);
+        INSERT INTO api_textmessage_fts (rowid, message) VALUES (new.id, new.message);
+    END''',
+    "INSERT INTO api_textmessage_fts (api_textmessage_fts) VALUES ('rebuild')"
+]
+SQLITE_DROP_INDEX_SQL = [
+    'DROP TRIGGER IF EXISTS api_textmessage_fts_insert',
+    'DROP TRIGGER IF EXISTS api_textmessage_fts_delete',
+    'DROP TRIGGER IF EXISTS api_textmessage_fts_update',
+    'DROP TABLE IF EXISTS api_textmessage_fts'
+]
+
+
+def install_index():
+    """
+    Creates the full-text index of the text messages and the index of player names, or fills them in again if they're
+    already there.
+    Returns False if the database doesn't support them.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for sql in POSTGRES_INDEX_SQL:
+                cursor.execute(sql)
+        elif connection.vendor == 'sqlite':
+            for sql in SQLITE_INDEX_SQL:
+                cursor.execute(sql)
+        else:
+            return False
+    return True
+
+
+def drop_index():
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for name in POSTGRES_INDEX_NAMES:
+                cursor.execute('DROP INDEX CONCURRENTLY IF EXISTS {}'.format(name))
+        elif connection.vendor == 'sqlite':
+            for sql in SQLITE_DROP_INDEX_SQL:
+                cursor.execute(sql)
+
+
+def get_terms(text):
+    # Only words are kept, which leaves nothing in the terms that either query syntax would treat as an operator.
+    return re.findall(r'\w+', text.lower())
+
+
+def get_postgres_query(terms, mode):
+    from django.contrib.postgres.search import SearchQuery
+    if mode == 'phrase':
+        return SearchQuery(' '.join(terms), config='simple', search_type='phrase')
+    if mode == 'prefix':
+        return SearchQuery(' & '.join("'{}':*".format(term) for term in terms), config='simple', search_type='raw')
+    return SearchQuery(' '.join(terms), config='simple')
+
+
+def get_fts_query(terms, mode):
+    if mode == 'phrase':
+        return '"{}"'.format(' '.join(terms))
+    if mode == 'prefix':
+        return ' '.join('"{}"*'.format(term) for term in terms)
+    return ' '.join('"{}"'.format(term) for term in terms)
+
+
+def has_fts_table():
+    return SQLITE_FTS_TABLE in connection.introspection.table_names()
+
+
+def search_text_messages(queryset, text, mode='plain'):
+    """
+    Returns the text messages in `queryset` that contain all of the words in `text`, best matches first, with how well
+    they match annotated as `rank`.
+
+    `mode` is one of:
+        plain: the words can be anywhere in the message.
+        phrase: the words have to be next to each other, in order.
+        prefix: the words can be the start of longer words.
+    """
+    terms = get_terms(text)
+    if len(terms) == 0:
+        return queryset.none()
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchRank, SearchVector
+        vector = SearchVector('message', config='simple')
+        query = get_postgres_query(terms, mode)
+        return queryset.annotate(search=vector).filter(search=query)\
+            .annotate(rank=SearchRank(vector, query)).order_by('-rank', '-id')
+    if connection.vendor == 'sqlite' and has_fts_table():
+        # FTS5 ranks with bm25, where lower is better.
+        return queryset.extra(
+            tables=[SQLITE_FTS_TABLE],
+            where=['api_textmessage_fts.rowid = api_textmessage.id', 'api_textmessage_fts MATCH %s'],
+            params=[get_fts_query(terms, mode)],
+            select={'rank': '-api_textmessage_fts.rank'}
+        ).order_by('-rank', '-id')
+    # Without an index, fall back to scanning the messages.
+    if mode == 'phrase':
+        condition = Q(message__icontains=' '.join(terms))
+    else:
+        condition = Q()
+        for term in terms:
+            condition &= Q(message__icontains=term)
+    return queryset.filter(condition).annotate(rank=Value(0.0, output_field=FloatField())).order_by('-id')
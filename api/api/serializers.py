@@ -28,7 +28,7 @@ class PlayerSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = models.Player
-        fields = ['id', 'names', 'kills', 'deaths', 'ff_kills', 'ff_deaths', 'playtime']
+        fields = ['id', 'name', 'names', 'kills', 'deaths', 'ff_kills', 'ff_deaths', 'playtime']
 
 
 class DamageTypeClassSerializer(serializers.ModelSerializer):
@@ -43,8 +43,17 @@ class LogSerializer(serializers.ModelSerializer):
         fields = ['id', 'crc', 'version', 'created_at']
 
 
+class LogJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = models.LogJob
+        fields = ['id', 'crc', 'status', 'error', 'log', 'created_at', 'started_at', 'finished_at']
+
+
 class RoundSerializer(serializers.ModelSerializer):
     log = LogSerializer(read_only=True)
+    num_players = serializers.IntegerField(source='summary.num_players', read_only=True)
+    num_kills = serializers.IntegerField(source='summary.kills', read_only=True)
+    is_interesting = serializers.BooleanField(source='summary.is_interesting', read_only=True)
 
     class Meta:
         model = models.Round
@@ -58,13 +67,13 @@ class FragSerializer(serializers.ModelSerializer):
 
     def get_killer(self, obj):
         return {
-            'id': obj.killer.id,
+            'id': obj.killer_id,
             'location': obj.killer_location
         }
 
     def get_victim(self, obj):
         return {
-            'id': obj.victim.id,
+            'id': obj.victim_id,
             'location': obj.victim_location
         }
 
@@ -81,7 +90,7 @@ class VehicleFragSerializer(serializers.ModelSerializer):
 
     def get_killer(self, obj):
         return {
-            'id': obj.killer.id,
+            'id': obj.killer_id,
             'team': obj.killer_team_index,
             'pawn': obj.killer_pawn_class.classname if obj.killer_pawn_class else None,
             'vehicle': obj.killer_vehicle_class.classname if obj.killer_vehicle_class else None,
@@ -160,10 +169,27 @@ class RallyPointSerializer(serializers.ModelSerializer):
     player = serializers.SerializerMethodField()
 
     def get_player(self, obj):
-        return {'id': obj.player.id, 'name': obj.player.name}
+        return {'id': obj.player.id, 'name': obj.player.name or 'Unknown'}
 
     class Meta:
         model = models.RallyPoint
         exclude = []
         fields = ['id', 'team_index', 'squad_index', 'player', 'spawn_count', 'is_established',
                   'establisher_count', 'destroyed_reason', 'round', 'location', 'created_at', 'lifespan']
+
+
+class LeaderboardEntrySerializer(serializers.ModelSerializer):
+
+    rank = serializers.IntegerField(read_only=True)
+    player = serializers.SerializerMethodField()
+    playtime = serializers.SerializerMethodField()
+
+    def get_player(self, obj):
+        return {'id': obj.player.id, 'name': obj.player.name or 'Unknown'}
+
+    def get_playtime(self, obj):
+        return isodate.duration_isoformat(obj.playtime)
+
+    class Meta:
+        model = models.LeaderboardEntry
+        fields = ['rank', 'player', 'map', 'week', 'kills', 'deaths', 'kd', 'ff_kills', 'playtime']
@@ -0,0 +1,158 @@
+import datetime
+from collections import defaultdict
+
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncWeek
+
+from . import models
+
+
+def calculate_player_stats(min_player_id, max_player_id):
+    """
+    Returns the aggregate stats of every player with an id in the (inclusive) range, keyed by player id.
+
+    This counts the same things as `Player.calculate_stats`, but for many players at once with a handful of grouped
+    queries instead of several queries per player.
+    """
+    stats = dict()
+    for player_id in models.Player.objects.filter(id__range=(min_player_id, max_player_id)).values_list('id', flat=True):
+        stats[player_id] = {
+            'kills': 0,
+            'deaths': 0,
+            'ff_kills': 0,
+            'ff_deaths': 0,
+            'playtime': datetime.timedelta()
+        }
+
+    frags = models.Frag.objects.order_by()
+    friendly_frags = frags.filter(killer_team_index=F('victim_team_index')).exclude(killer_id=F('victim_id'))
+    counts = (
+        ('kills', frags, 'killer_id'),
+        ('deaths', frags, 'victim_id'),
+        ('ff_kills', friendly_frags, 'killer_id'),
+        ('ff_deaths', friendly_frags, 'victim_id')
+    )
+    for stat, queryset, field in counts:
+        queryset = queryset.filter(**{field + '__gte': min_player_id, field + '__lte': max_player_id})
+        for player_id, count in queryset.values_list(field).annotate(count=Count('id')):
+            if player_id in stats:
+                stats[player_id][stat] = count
+
+    sessions = models.Player.sessions.through.objects.filter(player_id__gte=min_player_id, player_id__lte=max_player_id)
+    sessions = sessions.values('player_id').annotate(
+        playtime=Sum(ExpressionWrapper(F('session__ended_at') - F('session__started_at'), output_field=DurationField()))
+    ).order_by()
+    for session in sessions:
+        if session['player_id'] in stats and session['playtime'] is not None:
+            stats[session['player_id']]['playtime'] = session['playtime']
+
+    return stats
+
+
+def calculate_round_summaries(round_ids):
+    """
+    Returns an unsaved `RoundSummary` for each of the rounds, counting the same things that ingest records for them.
+    """
+    rounds = models.Round.objects.filter(id__in=round_ids).values('id', 'started_at', 'ended_at', 'log_id')
+    rounds = {x['id']: x for x in rounds}
+    log_ids = set(x['log_id'] for x in rounds.values())
+    player_counts = dict(models.Log.players.through.objects.filter(log_id__in=log_ids)
+                         .values_list('log_id').annotate(count=Count('player_id')).order_by())
+    summaries = dict()
+    for round_id, round in rounds.items():
+        summaries[round_id] = models.RoundSummary(
+            round_id=round_id,
+            num_players=player_counts.get(round['log_id'], 0),
+            duration=round['ended_at'] - round['started_at'] if round['ended_at'] is not None else None
+        )
+    deaths = models.Frag.objects.filter(round_id__in=rounds.keys()).values_list('round_id', 'victim_team_index')\
+        .annotate(count=Count('id')).order_by()
+    for round_id, team_index, count in deaths:
+        summary = summaries[round_id]
+        summary.kills += count
+        if team_index == 0:
+            summary.axis_deaths += count
+        elif team_index == 1:
+            summary.allied_deaths += count
+    for summary in summaries.values():
+        summary.is_interesting = summary.num_players > 1 and summary.kills > 0
+    return list(summaries.values())
+
+
+def calculate_damage_type_summaries(round_ids):
+    """
+    Returns an unsaved `DamageTypeSummary` for each damage type used in each of the rounds, counted in one query.
+    """
+    rounds = models.Round.objects.filter(id__in=round_ids).values('id', 'started_at', 'log__map_id', 'log__version')
+    rounds = {x['id']: x for x in rounds}
+    suicide = Q(killer_id=F('victim_id'))
+    counts = models.Frag.objects.filter(round_id__in=rounds.keys()).values('round_id', 'damage_type_id').annotate(
+        kills=Count('id'),
+        team_kills=Count('id', filter=Q(killer_team_index=F('victim_team_index')) & ~suicide),
+        suicides=Count('id', filter=suicide)
+    ).order_by()
+    summaries = []
+    for count in counts:
+        round = rounds[count['round_id']]
+        summaries.append(models.DamageTypeSummary(
+            map_id=round['log__map_id'],
+            version=round['log__version'],
+            started_at=round['started_at'],
+            **count
+        ))
+    return summaries
+
+
+def calculate_leaderboard_entries(min_player_id, max_player_id):
+    """
+    Returns the totals of every leaderboard entry of the players with an id in the (inclusive) range, keyed by
+    (player id, map id, week), counting the same things that ingest adds to them.
+
+    Sessions aren't tied to the log they were played in, so playtime on each map is left at zero.
+    """
+    entries = defaultdict(lambda: {
+        'kills': 0,
+        'deaths': 0,
+        'ff_kills': 0,
+        'playtime': datetime.timedelta()
+    })
+
+    frags = models.Frag.objects.order_by().annotate(week=TruncWeek('round__started_at'))
+    friendly_frags = frags.filter(killer_team_index=F('victim_team_index')).exclude(killer_id=F('victim_id'))
+    counts = (
+        ('kills', frags, 'killer_id'),
+        ('deaths', frags, 'victim_id'),
+        ('ff_kills', friendly_frags, 'killer_id')
+    )
+    for stat, queryset, field in counts:
+        queryset = queryset.filter(**{field + '__gte': min_player_id, field + '__lte': max_player_id})
+        for player_id, map_id, week, count in queryset.values_list(field, 'round__log__map_id', 'week')\
+                .annotate(count=Count('id')):
+            for key in ((player_id, None, None), (player_id, map_id, None), (player_id, None, week.date())):
+                entries[key][stat] += count
+
+    sessions = models.Player.sessions.through.objects.filter(player_id__gte=min_player_id, player_id__lte=max_player_id)
+    sessions = sessions.annotate(week=TruncWeek('session__started_at')).values_list('player_id', 'week').annotate(
+        playtime=Sum(ExpressionWrapper(F('session__ended_at') - F('session__started_at'), output_field=DurationField()))
+    ).order_by()
+    for player_id, week, playtime in sessions:
+        if playtime is None:
+            continue
+        for key in ((player_id, None, None), (player_id, None, week.date())):
+            entries[key]['playtime'] += playtime
+
+    return entries
+
+
+def calculate_player_activity(min_player_id, max_player_id):
+    """
+    Returns an unsaved `PlayerActivity` for each day that each player with an id in the (inclusive) range played on,
+    counting the same things that ingest records for them.
+    """
+    sessions = models.Player.sessions.through.objects.filter(player_id__gte=min_player_id, player_id__lte=max_player_id)
+    days = sessions.annotate(date=TruncDate('session__started_at')).values_list('player_id', 'date').annotate(
+        playtime=Sum(ExpressionWrapper(F('session__ended_at') - F('session__started_at'), output_field=DurationField())),
+        session_count=Count('id')
+    ).order_by()
+    return [models.PlayerActivity(player_id=player_id, date=date, playtime=playtime, session_count=session_count)
+            for player_id, date, playtime, session_count in days]
@@ -0,0 +1,11 @@
+from celery import shared_task
+
+from . import ingest
+
+
+@shared_task(ignore_result=True)
+def ingest_log_job(job_id):
+    # The job may have already been picked up by a `process_log_jobs` worker, in which case there is nothing to do.
+    job = ingest.claim_log_job(job_id)
+    if job is not None:
+        ingest.run_log_job(job)
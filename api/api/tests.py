@@ -1,3 +1,724 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+from json.decoder import JSONDecodeError
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import activity, benchmark, caching, heatmap, ingest, leaderboards, logreader, models, search, stats, words
+from .exceptions import DuplicateLogException
+from .management.commands import rebuild_player_stats
+
+
+def ingest_generated_log(log, crc):
+    file = io.BytesIO()
+    benchmark.write_log(log, file)
+    return ingest.ingest_log(logreader.LogReader(file), crc)
+
+
+class ListQueryCountTests(TestCase):
+    """
+    List pages should run the same number of queries however many rows are on them.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        map = models.Map.objects.create(name='DH-Foy')
+        log = models.Log.objects.create(crc=1, version='v9.1.0', map=map)
+        started_at = timezone.make_aware(datetime.datetime(2021, 3, 6, 22, 50))
+        cls.round = models.Round.objects.create(log=log, started_at=started_at,
+                                                ended_at=started_at + datetime.timedelta(minutes=50))
+        cls.damage_type = models.DamageTypeClass.objects.create(classname='DH_MP40DamType')
+        cls.pawn_class = models.PawnClass.objects.create(classname='DH_GermanPawn')
+        cls.vehicle_class = models.PawnClass.objects.create(classname='DH_PantherDTank')
+        cls.players = []
+        for i in range(10):
+            player = models.Player.objects.create(id=76561197960265728 + i, name='Player {}'.format(i))
+            player.names.add(models.PlayerName.objects.create(name='Player {}'.format(i)))
+            cls.players.append(player)
+
+    def create_rows(self, count):
+        started_at = self.round.started_at
+        for i in range(count):
+            killer, victim = self.players[i % 10], self.players[(i + 1) % 10]
+            models.Frag.objects.create(
+                round=self.round, damage_type=self.damage_type, hit_index=0, time=i, killer=killer,
+                killer_pawn_class=self.pawn_class, killer_team_index=0, victim=victim,
+                victim_pawn_class=self.pawn_class, victim_team_index=1
+            )
+            models.VehicleFrag.objects.create(
+                round=self.round, damage_type=self.damage_type, time=i, killer=killer, killer_team_index=0,
+                killer_pawn_class=self.pawn_class, vehicle_class=self.vehicle_class, vehicle_team_index=1
+            )
+            models.RallyPoint.objects.create(
+                round=self.round, team_index=0, squad_index=0, player=killer, location_x=0.0, location_y=0.0,
+                location_z=0.0, spawn_count=0, is_established=True, establisher_count=1,
+                created_at=started_at + datetime.timedelta(minutes=i),
+                destroyed_at=started_at + datetime.timedelta(minutes=i + 1) if i % 2 else None
+            )
+
+    def assertListQueries(self, path, count):
+        # One query to count the rows and one for the page.
+        self.create_rows(2)
+        with self.assertNumQueries(count):
+            self.client.get(path, {'limit': 25})
+        self.create_rows(20)
+        with self.assertNumQueries(count):
+            response = self.client.get(path, {'limit': 25})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 22)
+        return sorted(response.json()['results'], key=lambda x: x['id'])
+
+    def test_frags(self):
+        results = self.assertListQueries('/frags/', 2)
+        self.assertEqual(results[0]['killer']['id'], self.players[0].id)
+        self.assertEqual(results[0]['victim']['id'], self.players[1].id)
+
+    def test_vehicle_frags(self):
+        results = self.assertListQueries('/vehicle-frags/', 2)
+        self.assertEqual(results[0]['killer']['pawn'], 'DH_GermanPawn')
+        self.assertEqual(results[0]['vehicle']['class'], 'DH_PantherDTank')
+
+    def test_rally_points(self):
+        results = self.assertListQueries('/rally-points/', 2)
+        self.assertEqual(results[0]['player'], {'id': self.players[0].id, 'name': 'Player 0'})
+        # Rally points that were never destroyed last until the end of the round.
+        self.assertEqual(results[0]['lifespan'], 'PT50M')
+        self.assertEqual(results[1]['lifespan'], 'PT1M')
+
+
+    def test_scoreboard(self):
+        self.round.log.players.add(*self.players)
+        path = '/rounds/{}/scoreboard/'.format(self.round.id)
+        # The round, its players, their kills and deaths, and the names of those on the page.
+        self.create_rows(2)
+        with self.assertNumQueries(4):
+            self.client.get(path, {'limit': 3})
+        self.create_rows(20)
+        with self.assertNumQueries(4):
+            response = self.client.get(path, {'ordering': '-kills', 'limit': 3, 'offset': 1})
+        # Everyone is sorted before the page is cut out, with ties in order of id.
+        self.assertEqual(response.json()['count'], 10)
+        self.assertEqual([(x['player']['id'], x['player']['name'], x['kills']) for x in response.json()['results']], [
+            (self.players[1].id, 'Player 1', 3), (self.players[2].id, 'Player 2', 2), (self.players[3].id, 'Player 3', 2)
+        ])
+        response = self.client.get(path, {'ordering': 'kd', 'limit': 1})
+        self.assertEqual([(x['player']['id'], x['deaths']) for x in response.json()['results']], [(self.players[2].id, 3)])
+        response = self.client.get(path, {'ordering': 'kd', 'limit': 1, 'offset': 9})
+        self.assertEqual([(x['player']['id'], x['kd']) for x in response.json()['results']], [(self.players[0].id, 1.5)])
+
+class PaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        log = models.Log.objects.create(crc=1, version='v9.1.0', map=models.Map.objects.create(name='DH-Foy'))
+        player = models.Player.objects.create(id=76561197960265728)
+        sent_at = timezone.make_aware(datetime.datetime(2021, 3, 6, 22, 50))
+        # Messages sent at the same time are told apart by their id.
+        for minutes in (0, 1, 1, 1, 2, 3, 3):
+            models.TextMessage.objects.create(log=log, sender=player, message='gg', type='Say', team_index=0,
+                                              squad_index=0, sent_at=sent_at + datetime.timedelta(minutes=minutes))
+        cls.ids = list(models.TextMessage.objects.order_by('-sent_at', '-id').values_list('id', flat=True))
+
+    def get_page(self, path, params=None, queries=2):
+        with self.assertNumQueries(queries):
+            response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_limit_offset(self):
+        page = self.get_page('/text-messages/', {'limit': 3, 'offset': 3})
+        self.assertEqual(list(page.keys()), ['count', 'next', 'previous', 'results'])
+        self.assertEqual(page['count'], 7)
+        self.assertEqual(len(page['results']), 3)
+        self.assertIn('offset=6', page['next'])
+        self.assertNotIn('cursor', page['next'])
+
+    def test_cursor(self):
+        pages = []
+        page = self.client.get('/text-messages/', {'cursor': '', 'limit': 3}).json()
+        self.assertNotIn('count', page)
+        pages.append([x['id'] for x in page['results']])
+        while page['next'] is not None:
+            page = self.client.get(page['next']).json()
+            pages.append([x['id'] for x in page['results']])
+        self.assertEqual(pages, [self.ids[0:3], self.ids[3:6], self.ids[6:]])
+        # And back again.
+        while page['previous'] is not None:
+            page = self.client.get(page['previous']).json()
+            pages.pop()
+            self.assertEqual([x['id'] for x in page['results']], pages[-1])
+        self.assertEqual(len(pages), 1)
+
+    def test_estimate(self):
+        # Only PostgreSQL keeps statistics to estimate from, so the rows are counted here.
+        page = self.get_page('/text-messages/', {'limit': 3, 'count': 'estimate'})
+        self.assertEqual((page['count'], len(page['results'])), (7, 3))
+        self.assertIn('offset=3', page['next'])
+        # A short page is the last one whatever the estimate says, so there's nothing to estimate.
+        page = self.get_page('/text-messages/', {'limit': 3, 'offset': 5, 'count': 'estimate'}, queries=1)
+        self.assertEqual((page['count'], page['next']), (7, None))
+        page = self.get_page('/text-messages/', {'cursor': '', 'limit': 3, 'count': 'estimate'})
+        self.assertEqual(list(page.keys()), ['count', 'next', 'previous', 'results'])
+        self.assertEqual([x['id'] for x in page['results']], self.ids[0:3])
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class CachedResponseTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.map = models.Map.objects.create(name='DH-Foy')
+        cls.other_map = models.Map.objects.create(name='DH-Carentan')
+        cls.log = models.Log.objects.create(crc=1, version='v9.1.0', map=cls.map)
+        cls.player = models.Player.objects.create(id=76561197960265728, name='Player 0')
+
+    def setUp(self):
+        caching.invalidate_all()
+
+    def test_hit(self):
+        path = '/maps/{}/summary/'.format(self.map.id)
+        first = self.client.get(path)
+        # One query looks up the generations for the ETag, the other those that the response is cached under.
+        with self.assertNumQueries(2):
+            second = self.client.get(path)
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(caching.get_metrics()['maps-summary'], {'hits': 1, 'misses': 1})
+
+    def test_query_params(self):
+        path = '/players/damage_type_kills/'
+        self.client.get(path, {'killer_id': self.player.id})
+        self.client.get(path, {'killer_id': self.player.id, 'limit': 5})
+        self.client.get(path, {'limit': 5, 'killer_id': self.player.id})
+        self.assertEqual(caching.get_metrics()['players-damage-type-kills'], {'hits': 1, 'misses': 2})
+
+    def test_invalidation(self):
+        path = '/maps/{}/summary/'.format(self.map.id)
+        self.client.get(path)
+        caching.bump_generations([('map', self.other_map.id), ('player', self.player.id)])
+        with self.assertNumQueries(2):
+            self.client.get(path)
+        started_at = timezone.make_aware(datetime.datetime(2021, 3, 6, 22, 50))
+        round = models.Round.objects.create(log=self.log, started_at=started_at)
+        models.RoundSummary.objects.create(round=round, kills=3, axis_deaths=1, allied_deaths=2, num_players=2,
+                                           is_interesting=True)
+        caching.invalidate_log(self.log, [round.id], [self.player.id])
+        response = self.client.get(path)
+        self.assertEqual(response.json()['round_count'], 1)
+
+
+class ConditionalResponseTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.map = models.Map.objects.create(name='DH-Foy')
+        models.Log.objects.create(crc=1, version='v9.1.0', map=cls.map)
+
+    def setUp(self):
+        caching.invalidate_all()
+
+    def test_not_modified(self):
+        path = '/maps/{}/summary/'.format(self.map.id)
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        # Only the version is looked up.
+        with self.assertNumQueries(1):
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(path, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_log(self):
+        path = '/maps/{}/summary/'.format(self.map.id)
+        etag = self.client.get(path)['ETag']
+        log = models.Log.objects.create(crc=2, version='v9.1.0', map=models.Map.objects.create(name='DH-Carentan'))
+        caching.invalidate_log(log, [], [])
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        log = models.Log.objects.create(crc=3, version='v9.1.0', map=self.map)
+        caching.invalidate_log(log, [], [])
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_rebuild(self):
+        path = '/maps/{}/summary/'.format(self.map.id)
+        etag = self.client.get(path)['ETag']
+        caching.invalidate_all()
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class RangeHistogramTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        map = models.Map.objects.create(name='DH-Foy')
+        cls.log = models.Log.objects.create(crc=1, version='v9.1.0', map=map)
+        cls.round = models.Round.objects.create(log=cls.log,
+                                                started_at=timezone.make_aware(datetime.datetime(2021, 3, 6, 22, 50)))
+        cls.player = models.Player.objects.create(id=76561197960265728)
+        cls.damage_types = [models.DamageTypeClass.objects.create(classname=x)
+                            for x in ('DH_MP40DamType', 'DH_Kar98DamType')]
+        # Bins of 5 meters are 301.76 units long.
+        for damage_type, distance in ((0, 0), (0, 300), (0, 302), (0, 1000), (0, 2000), (1, 10)):
+            cls.create_frag(cls.damage_types[damage_type], distance)
+
+    @classmethod
+    def create_frag(cls, damage_type, distance):
+        models.Frag.objects.create(round=cls.round, damage_type=damage_type, hit_index=0, time=0, killer=cls.player,
+                                   killer_team_index=0, victim=cls.player, victim_team_index=1, distance=distance)
+
+    def setUp(self):
+        caching.invalidate_all()
+
+    def get_histogram(self, params=None):
+        params = dict({'damage_type_ids[]': [x.id for x in self.damage_types], 'bin_count': 4}, **(params or {}))
+        return self.client.get('/frags/range_histogram/', params)
+
+    def test_bins(self):
+        data = self.get_histogram().json()
+        self.assertEqual(data[str(self.damage_types[0].id)], {'total': 4, 'bins': [[0, 2], [5, 1], [10, 0], [15, 1]]})
+        self.assertEqual(data[str(self.damage_types[1].id)], {'total': 1, 'bins': [[0, 1], [5, 0], [10, 0], [15, 0]]})
+        data = self.get_histogram({'bin_size': 2.5, 'started_after': '2021-03-07'}).json()
+        self.assertEqual(data[str(self.damage_types[0].id)]['bins'], [[0.0, 0], [2.5, 0], [5.0, 0], [7.5, 0]])
+        self.assertEqual(self.get_histogram({'bin_count': 0}).status_code, 400)
+        self.assertEqual(self.get_histogram({'bin_size': 'x'}).status_code, 400)
+
+    def test_invalidation(self):
+        first = self.get_histogram().json()
+        self.create_frag(self.damage_types[1], 10)
+        # The only query looks up the generation of every log.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_histogram().json(), first)
+        caching.invalidate_log(self.log, [self.round.id], [self.player.id])
+        self.assertEqual(self.get_histogram().json()[str(self.damage_types[1].id)]['total'], 2)
+        self.assertEqual(caching.get_metrics()['frags-range-histogram'], {'hits': 1, 'misses': 2})
+
+
+class DamageTypeFriendlyFireTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        map = models.Map.objects.create(name='DH-Foy')
+        log = models.Log.objects.create(crc=1, version='v9.1.0', map=map)
+        round = models.Round.objects.create(log=log, started_at=timezone.make_aware(datetime.datetime(2021, 3, 6, 22, 50)))
+        cls.damage_type = models.DamageTypeClass.objects.create(classname='DH_MP40DamType')
+        cls.unused_damage_type = models.DamageTypeClass.objects.create(classname='DH_PanzerfaustDamType')
+        players = [models.Player.objects.create(id=76561197960265728 + i) for i in range(3)]
+        for killer, victim, victim_team_index in ((0, 1, 1), (0, 2, 0), (0, 0, 0)):
+            models.Frag.objects.create(round=round, damage_type=cls.damage_type, hit_index=0, time=0,
+                                       killer=players[killer], killer_team_index=0, victim=players[victim],
+                                       victim_team_index=victim_team_index)
+        models.DamageTypeSummary.objects.bulk_create(stats.calculate_damage_type_summaries([round.id]))
+
+    def setUp(self):
+        caching.invalidate_all()
+
+    def test_report(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/reports/damage_type_friendly_fire/')
+        results = {x['id']: x for x in response.json()['results']}
+        self.assertEqual(results[self.damage_type.id], {
+            'id': self.damage_type.id, 'kills': 3, 'team_kills': 1, 'suicides': 1, 'team_kill_ratio': 1 / 3
+        })
+        self.assertEqual(results[self.unused_damage_type.id]['team_kill_ratio'], 0.0)
+        response = self.client.get('/reports/damage_type_friendly_fire/', {'started_after': '2021-03-07'})
+        self.assertEqual(response.json()['results'][0]['kills'], 0)
+
+
+class WordCloudTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.map = models.Map.objects.create(name='DH-Foy')
+        other_map = models.Map.objects.create(name='DH-Carentan')
+        cls.players = [models.Player.objects.create(id=76561197960265728 + i) for i in range(2)]
+        sent_at = timezone.make_aware(datetime.datetime(2021, 3, 6, 22, 50))
+        messages = (
+            (cls.map, 0, 0, 'Push the bridge!'),
+            (cls.map, 0, 1, 'push, PUSH... need ammo'),
+            (cls.map, 1, 1, "don't push the bridge"),
+            (other_map, 0, 0, 'ammo ammo ammo'),
+        )
+        for i, (map, sender, team_index, message) in enumerate(messages):
+            log = models.Log.objects.create(crc=i, version='v9.1.0', map=map)
+            models.TextMessage.objects.create(log=log, sender=cls.players[sender], message=message, type='Say',
+                                              sent_at=sent_at, team_index=team_index, squad_index=0)
+            words.rebuild_word_counts(log)
+
+    def get_words(self, params):
+        response = self.client.get('/text-messages/words/', params)
+        return [(x['text'], x['value']) for x in response.json()['data']]
+
+    def test_get_words(self):
+        self.assertEqual(words.get_words("GG, wp!! don't push... 3.5 Игрок"),
+                         ['gg', 'wp', "don't", 'push', '3', '5', 'игрок'])
+
+    def test_word_counts(self):
+        # Stop words ("the") are left out.
+        self.assertEqual(self.get_words({}), [('ammo', 4), ('push', 4), ('bridge', 2), ("don't", 1), ('need', 1)])
+        self.assertEqual(self.get_words({'map': self.map.id, 'team_index': 1}),
+                         [('push', 3), ('ammo', 1), ('bridge', 1), ("don't", 1), ('need', 1)])
+
+    def test_messages(self):
+        # Word counts aren't kept by sender or message, so these are counted up from the messages instead.
+        self.assertEqual(self.get_words({'sender': self.players[1].id}), [('bridge', 1), ("don't", 1), ('push', 1)])
+        self.assertEqual(self.get_words({'message': 'ammo', 'map': self.map.id}), [('push', 2), ('ammo', 1), ('need', 1)])
+        self.assertEqual(self.get_words({'search': 'bridge'}), [('bridge', 2), ('push', 2), ("don't", 1)])
+
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        log = models.Log.objects.create(crc=1, version='v9.1.0', map=models.Map.objects.create(name='DH-Foy'))
+        cls.players = [models.Player.objects.create(id=76561197960265728 + i, name=name)
+                       for i, name in enumerate(('Mr. Player', 'player two', None))]
+        sent_at = timezone.make_aware(datetime.datetime(2021, 3, 6, 22, 50))
+        for message in ('push the bridge', 'bridge, push!', 'the bridges are out', 'need ammo'):
+            cls.create_message(log, message, sent_at)
+
+    @classmethod
+    def create_message(cls, log, message, sent_at):
+        models.TextMessage.objects.create(log=log, sender=cls.players[0], message=message, type='Say', sent_at=sent_at,
+                                          team_index=0, squad_index=0)
+
+    def search(self, text, mode='plain'):
+        response = self.client.get('/text-messages/', {'search': text, 'search_mode': mode})
+        return sorted(x['message'] for x in response.json()['results'])
+
+    def assertSearches(self):
+        self.assertEqual(self.search('Push, bridge'), ['bridge, push!', 'push the bridge'])
+        self.assertEqual(self.search('push the', 'phrase'), ['push the bridge'])
+        self.assertEqual(self.search('!!'), [])
+
+    def test_fallback(self):
+        self.assertFalse(search.has_fts_table())
+        self.assertSearches()
+        # Without an index, words are matched anywhere in the message, even within other words.
+        self.assertEqual(self.search('bridg', 'prefix'), ['bridge, push!', 'push the bridge', 'the bridges are out'])
+        self.assertEqual(self.search('the bridge', 'phrase'), ['push the bridge', 'the bridges are out'])
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+    def test_sqlite(self):
+        self.assertTrue(search.install_index())
+        self.assertTrue(search.has_fts_table())
+        self.assertSearches()
+        self.assertEqual(self.search('bridg'), [])
+        self.assertEqual(self.search('bridg', 'prefix'), ['bridge, push!', 'push the bridge', 'the bridges are out'])
+        self.assertEqual(self.search('the bridge', 'phrase'), ['push the bridge'])
+        # Messages are kept in step with the index as they're added and removed.
+        self.create_message(models.Log.objects.get(), 'bridge down', timezone.now())
+        models.TextMessage.objects.filter(message='bridge, push!').delete()
+        self.assertEqual(self.search('bridge'), ['bridge down', 'push the bridge'])
+        search.drop_index()
+        self.assertFalse(search.has_fts_table())
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL only')
+    def test_postgresql(self):
+        self.assertSearches()
+        self.assertEqual(self.search('bridg'), [])
+        self.assertEqual(self.search('bridg', 'prefix'), ['bridge, push!', 'push the bridge', 'the bridges are out'])
+        self.assertEqual(self.search('the bridge', 'phrase'), ['push the bridge'])
+
+    def test_players(self):
+        def search_players(text):
+            response = self.client.get('/players/', {'search': text})
+            return sorted(x['id'] for x in response.json()['results'])
+
+        # Names are matched from the start, ignoring case.
+        self.assertEqual(search_players('PLAYER'), [self.players[1].id])
+        self.assertEqual(search_players('mr. p'), [self.players[0].id])
+        self.assertEqual(search_players(str(self.players[2].id)), [self.players[2].id])
+        self.assertEqual(search_players('7656'), [])
+
+
+class LeaderboardTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.players = [models.Player.objects.create(id=76561197960265728 + i) for i in range(4)]
+        week = datetime.date(2021, 3, 1)
+        deltas = dict()
+        for player, kills, deaths in zip(cls.players, (10, 7, 7, 3), (5, 0, 7, 1)):
+            delta = {'kills': kills, 'deaths': deaths, 'ff_kills': 0, 'playtime': datetime.timedelta(minutes=kills)}
+            deltas[(player.id, None, None)] = delta
+            deltas[(player.id, None, week)] = delta
+        leaderboards.add_entries(deltas)
+        # Adding onto existing entries.
+        leaderboards.add_entries({(cls.players[3].id, None, None): {
+            'kills': 1, 'deaths': 1, 'ff_kills': 1, 'playtime': datetime.timedelta()
+        }})
+
+    def test_ranks(self):
+        response = self.client.get('/leaderboards/', {'stat': 'kills'})
+        self.assertEqual([(x['rank'], x['kills']) for x in response.json()['results']], [(1, 10), (2, 7), (2, 7), (4, 4)])
+        response = self.client.get('/leaderboards/', {'stat': 'kills', 'offset': 2, 'limit': 1})
+        self.assertEqual(response.json()['results'][0]['rank'], 2)
+        response = self.client.get('/leaderboards/', {'stat': 'kd', 'week': '2021-03-04'})
+        self.assertEqual([x['kd'] for x in response.json()['results']], [7.0, 3.0, 2.0, 1.0])
+
+    def test_rank(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/leaderboards/rank/', {'stat': 'kills', 'player_id': self.players[3].id})
+        self.assertEqual(response.json()['rank'], 4)
+        self.assertEqual(response.json()['kd'], 2.0)
+        response = self.client.get('/leaderboards/rank/', {'stat': 'kills', 'player_id': self.players[3].id,
+                                                           'week': '2021-03-08'})
+        self.assertEqual(response.status_code, 404)
+
+
+class HeatmapTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Cells are 10 units across at the finest zoom level, and 80 at zoom level 4.
+        cls.map = models.Map.objects.create(name='DH-Foy', bounds_ne_x=1280.0, bounds_ne_y=1280.0, bounds_sw_x=0.0,
+                                            bounds_sw_y=0.0)
+        log = models.Log.objects.create(crc=1, version='v9.1.0', map=cls.map)
+        cls.damage_type = models.DamageTypeClass.objects.create(classname='DH_MP40DamType')
+        player = models.Player.objects.create(id=76561197960265728)
+        started_at = timezone.make_aware(datetime.datetime(2021, 3, 6, 22, 50))
+        # The second round is the week after.
+        for days, locations in ((0, ((5, 5, 0), (15, 5, 0), (85, 5, 0), (5, 5, 1), (-5, 5, 0))), (7, ((5, 5, 0),))):
+            round = models.Round.objects.create(log=log, started_at=started_at + datetime.timedelta(days=days))
+            for x, y, team_index in locations:
+                models.Frag.objects.create(round=round, damage_type=cls.damage_type, hit_index=0, time=0,
+                                           killer=player, killer_team_index=0, victim=player,
+                                           victim_team_index=team_index, victim_location_x=x, victim_location_y=y)
+        heatmap.rebuild_cells(cls.map)
+
+    def get_cells(self, params):
+        response = self.client.get('/maps/{}/heatmap/'.format(self.map.id), params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(tuple(x) for x in response.json()['data'])
+
+    def test_zoom(self):
+        # Locations outside of the bounds are left out.
+        self.assertEqual(models.HeatmapCell.objects.count(), 5)
+        self.assertEqual(self.get_cells({'zoom': 7}), [(5.0, 5.0, 3), (15.0, 5.0, 1), (85.0, 5.0, 1)])
+        self.assertEqual(self.get_cells({'zoom': 4}), [(40.0, 40.0, 4), (120.0, 40.0, 1)])
+        self.assertEqual(self.get_cells({'cell_size': 75}), [(40.0, 40.0, 4), (120.0, 40.0, 1)])
+
+    def test_filters(self):
+        self.assertEqual(self.get_cells({'zoom': 4, 'team': 1}), [(40.0, 40.0, 1)])
+        self.assertEqual(self.get_cells({'zoom': 4, 'started_after': '2021-03-10'}), [(40.0, 40.0, 1)])
+        self.assertEqual(self.get_cells({'zoom': 4, 'started_before': '2021-03-07', 'damage_type_id': self.damage_type.id}),
+                         [(40.0, 40.0, 3), (120.0, 40.0, 1)])
+        response = self.client.get('/maps/{}/heatmap/'.format(self.map.id), {'zoom': 3})
+        self.assertEqual(response.status_code, 400)
+
+    def test_bounds_changed(self):
+        log = benchmark.generate_log(players=8, rounds=1, frags=20, seed=1)
+        log['map'] = {'name': 'DH-Carentan', 'bounds': {'ne': [40000.0, 40000.0], 'sw': [-40000.0, -40000.0]}, 'offset': 0}
+        ingest_generated_log(log, 2)
+        ingest_generated_log(dict(log, text_messages=[]), 3)
+        cells = models.HeatmapCell.objects.filter(map__name='DH-Carentan')
+        self.assertEqual(sum(cells.values_list('count', flat=True)), 40)
+        # Everything counted so far no longer lines up with the grid, so only the frags of the new log are left.
+        log['map']['bounds'] = {'ne': [50000.0, 50000.0], 'sw': [-50000.0, -50000.0]}
+        with self.assertLogs(ingest.logger, 'WARNING'):
+            ingest_generated_log(log, 4)
+        self.assertEqual(sum(cells.values_list('count', flat=True)), 20)
+        heatmap.rebuild_cells(models.Map.objects.get(name='DH-Carentan'))
+        self.assertEqual(sum(cells.values_list('count', flat=True)), 60)
+
+
+class PlayerActivityTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.player = models.Player.objects.create(id=76561197960265728)
+        sessions = []
+        # Two sessions on a Monday, one the day after and one in June.
+        for day, hours in ((7, 1), (7, 2), (8, 1), (98, 3)):
+            started_at = timezone.make_aware(datetime.datetime(2021, 3, 1, 12)) + datetime.timedelta(days=day)
+            sessions.append((cls.player.id, models.Session(ip='127.0.0.1', started_at=started_at,
+                                                           ended_at=started_at + datetime.timedelta(hours=hours))))
+        activity.add_activity(activity.count_sessions(sessions[:2]))
+        activity.add_activity(activity.count_sessions(sessions[2:]))
+
+    def get_sessions(self, params):
+        with self.assertNumQueries(1):
+            return self.client.get('/players/{}/sessions/'.format(self.player.id), params).json()
+
+    def test_granularity(self):
+        self.assertEqual(self.get_sessions({})['session_counts'], {'2021-03-08': 2, '2021-03-09': 1, '2021-06-07': 1})
+        self.assertEqual(self.get_sessions({'granularity': 'week'})['results'], {
+            '2021-03-08': 'P0DT04H00M00S', '2021-06-07': 'P0DT03H00M00S'
+        })
+        self.assertEqual(self.get_sessions({'granularity': 'month', 'started_before': '2021-05-31'})['session_counts'],
+                         {'2021-03-01': 3})
+
+
+class IngestTests(TestCase):
+    """
+    What ingest adds up as it goes should come out the same as recounting it from scratch.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = benchmark.generate_log(players=16, rounds=2, frags=100, text_messages=50)
+        cls.log = ingest_generated_log(cls.data, 1)
+
+    def get_rows(self, model):
+        fields = [x.attname for x in model._meta.concrete_fields if not x.primary_key]
+        return sorted(model.objects.values_list(*fields), key=str)
+
+    def test_row_counts(self):
+        rounds = self.data['rounds']
+        counts = (
+            (models.Log, 1),
+            (models.Player, len(self.data['players'])),
+            (models.Session, len(self.data['players'])),
+            # Messages from the admin aren't from a player, so they're left out.
+            (models.TextMessage, len([x for x in self.data['text_messages']
+                                      if x['sender'] != benchmark.ADMIN_PLAYER_ID])),
+            (models.Round, len(rounds)),
+            (models.RoundSummary, len(rounds)),
+            (models.Frag, sum(len(x['frags']) for x in rounds)),
+            (models.VehicleFrag, sum(len(x['vehicle_frags']) for x in rounds)),
+            (models.RallyPoint, sum(len(x['rally_points']) for x in rounds)),
+            (models.Construction, sum(len(x['constructions']) for x in rounds)),
+            (models.Event, sum(len(x['events']) for x in rounds)),
+            (models.PlayerName, len(set(y for x in self.data['players'] for y in x['names']))),
+            (models.Player.names.through, sum(len(set(x['names'])) for x in self.data['players'])),
+            (models.Log.players.through, len(self.data['players'])),
+            (models.LeaderboardEntry, 3 * len(self.data['players'])),
+        )
+        for model, count in counts:
+            self.assertEqual(model.objects.count(), count, model.__name__)
+
+    def test_player_stats(self):
+        expected = stats.calculate_player_stats(0, 2 ** 63 - 1)
+        for player in models.Player.objects.all():
+            self.assertEqual({x: getattr(player, x) for x in expected[player.id]}, expected[player.id], player.id)
+
+    def test_rebuilds(self):
+        rebuilds = (
+            (models.RoundSummary, 'rebuild_round_summaries'),
+            (models.DamageTypeSummary, 'rebuild_damage_type_summaries'),
+            (models.WordCount, 'rebuild_word_counts'),
+            (models.LeaderboardEntry, 'rebuild_leaderboards'),
+            (models.PlayerActivity, 'rebuild_player_activity'),
+        )
+        for model, command in rebuilds:
+            rows = self.get_rows(model)
+            self.assertGreater(len(rows), 0, command)
+            call_command(command, stdout=io.StringIO())
+            self.assertEqual(self.get_rows(model), rows, command)
+
+    def test_distances(self):
+        locations = np.array([[0.0, 0.0, 0.0]] * 4)
+        to_locations = np.array([[0.5, 0.0, 0.0], [1.5, 0.0, 0.0], [3.0, 4.0, 0.0], [0.0, 0.0, -2.6]])
+        self.assertEqual(ingest.get_distances(locations, to_locations), [0, 2, 5, 3])
+
+    def test_duplicate(self):
+        with self.assertRaises(DuplicateLogException) as context:
+            ingest_generated_log(self.data, 1)
+        self.assertEqual(context.exception.status_code, 409)
+        self.assertEqual(models.Log.objects.count(), 1)
+
+
+class RebuildPlayerStatsTests(TestCase):
+
+    def test_rebuild(self):
+        players = [models.Player.objects.create(id=76561197960265728 + i, kills=100) for i in range(3)]
+        map = models.Map.objects.create(name='DH-Foy')
+        log = models.Log.objects.create(crc=1, version='v9.1.0', map=map)
+        round = models.Round.objects.create(log=log, started_at=timezone.make_aware(datetime.datetime(2021, 3, 6, 22, 50)))
+        damage_type = models.DamageTypeClass.objects.create(classname='DH_MP40DamType')
+        for killer, victim, victim_team_index in ((0, 1, 1), (0, 2, 0), (1, 0, 0)):
+            models.Frag.objects.create(round=round, damage_type=damage_type, hit_index=0, time=0,
+                                       killer=players[killer], killer_team_index=0, victim=players[victim],
+                                       victim_team_index=victim_team_index)
+        calls = mock.Mock()
+        with mock.patch.object(rebuild_player_stats, 'advisory_lock', calls.advisory_lock), \
+                mock.patch.object(rebuild_player_stats, 'calculate_player_stats', calls.calculate_player_stats):
+            calls.calculate_player_stats.side_effect = stats.calculate_player_stats
+            call_command('rebuild_player_stats', chunk_size=2, stdout=io.StringIO())
+        ids = [x.id for x in players]
+        # Each chunk's players are locked before their stats are worked out, so that ingest can't add to them between.
+        self.assertEqual(calls.mock_calls, [
+            mock.call.advisory_lock('player', *ids[:2]), mock.call.calculate_player_stats(ids[0], ids[1]),
+            mock.call.advisory_lock('player', ids[2]), mock.call.calculate_player_stats(ids[2], ids[2]),
+        ])
+        self.assertEqual([(x.kills, x.deaths, x.ff_kills, x.ff_deaths) for x in models.Player.objects.order_by('id')],
+                         [(2, 1, 1, 1), (1, 1, 1, 0), (0, 1, 0, 1)])
+
+
+class LogJobTests(TestCase):
+
+    def test_claim_abandoned(self):
+        job = models.LogJob.objects.create(crc=1, status='ingesting', started_at=timezone.now())
+        self.assertIsNone(ingest.claim_log_job())
+        models.LogJob.objects.filter(id=job.id).update(started_at=timezone.now() - datetime.timedelta(days=1))
+        self.assertEqual(ingest.claim_log_job().id, job.id)
+        self.assertIsNone(ingest.claim_log_job())
+
+
+class LogReaderTests(SimpleTestCase):
+    """
+    The reader should come up with the same thing as decoding the whole log and handing it to `json.loads`, however the
+    log is split up into reads.
+    """
+    # 0xC0 0xE1 is "Аб" in cp1251 and 0x98 isn't anything, so it's read as a space.
+    LOG = b'{"version": "v9.1.0", "map": {"name": "DH-Foy"},\r\n' \
+          b'"players": [{"id": "76561197960265728", "names": ["\\u0410\\"b\\\\c", "\xc0\xe1\x98"]}],\r\n' \
+          b'"text_messages": [{"message": "gg \\"wp\\""}], "rounds": [{"frags": [1, 2.5, -3e2, true, null]}, {}]}'
+    # The rounds come first in some logs.
+    ROUNDS_FIRST_LOG = b'{"rounds": [{"frags": [12345]}, {"frags": [678]}], "version": "v9.1.0", "map": {},\r\n' \
+                       b'"players": [], "text_messages": [], "rounds_played": 2}'
+    # Versions <=v9.0.9 didn't escape backslashes.
+    UNESCAPED_LOG = b'{"version": "v9.0.9", "map": {}, "players": [{"names": ["C:\\q\\"]}], "text_messages": [],' \
+                    b'"rounds": []}'
+
+    def decode(self, data, escape_backslashes=False):
+        text = data.replace(b'\r', b'').replace(b'\n', b'').decode('cp1251', errors='log_space')
+        if escape_backslashes:
+            text = text.replace('\\', '\\\\')
+        return json.loads(text)
+
+    def read(self, data, chunk_size, escape_backslashes=False):
+        with mock.patch.object(logreader, 'CHUNK_SIZE', chunk_size):
+            reader = logreader.LogReader(io.BytesIO(data), escape_backslashes=escape_backslashes)
+            log = reader.read_header()
+            log['rounds'] = list(reader.iter_rounds())
+        return log
+
+    def test_chunk_sizes(self):
+        expected = self.decode(self.LOG)
+        self.assertEqual(expected['players'][0]['names'], ['\u0410"b\\c', '\u0410\u0431 '])
+        # Reads of every size up to the longest value split each escape sequence and number at every point.
+        for chunk_size in list(range(1, 40)) + [64, 65536]:
+            self.assertEqual(self.read(self.LOG, chunk_size), expected, chunk_size)
+
+    def test_rounds_first(self):
+        expected = self.decode(self.ROUNDS_FIRST_LOG)
+        for chunk_size in (1, 7, 64, 65536):
+            log = self.read(self.ROUNDS_FIRST_LOG, chunk_size)
+            self.assertEqual(log['rounds'], expected['rounds'])
+            self.assertEqual(log['rounds_played'], 2)
+
+    def test_escape_backslashes(self):
+        with self.assertRaises(JSONDecodeError):
+            self.read(self.UNESCAPED_LOG, 7)
+        expected = self.decode(self.UNESCAPED_LOG, escape_backslashes=True)
+        self.assertEqual(expected['players'][0]['names'], ['C:\\q\\'])
+        for chunk_size in (1, 7, 64, 65536):
+            self.assertEqual(self.read(self.UNESCAPED_LOG, chunk_size, escape_backslashes=True), expected)
+
+    def test_escape_backslashes_retry(self):
+        readers = []
+
+        def ingest_log(reader, crc):
+            readers.append(reader)
+            return reader.read_header()
+
+        with mock.patch.object(ingest, 'ingest_log', ingest_log), mock.patch.object(ingest, 'store_log_file'):
+            header = ingest.ingest_log_file(io.BytesIO(self.UNESCAPED_LOG), 1)
+        self.assertEqual([x.escape_backslashes for x in readers], [False, True])
+        self.assertEqual(header['players'][0]['names'], ['C:\\q\\'])
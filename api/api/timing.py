@@ -0,0 +1,53 @@
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+class PhaseTimer(object):
+    """
+    Adds up the time spent and the queries run in each named phase of a piece of work. Phases don't nest; queries run
+    outside of any phase are counted under 'other'.
+    """
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self._current = None
+
+    @contextmanager
+    def phase(self, name):
+        stats = self._get_stats(name)
+        self._current = stats
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats['seconds'] += time.perf_counter() - started_at
+            stats['calls'] += 1
+            self._current = None
+
+    @contextmanager
+    def count_queries(self):
+        with connection.execute_wrapper(self._count_query):
+            yield
+
+    def _count_query(self, execute, sql, params, many, context):
+        stats = self._current if self._current is not None else self._get_stats('other')
+        stats['queries'] += 1
+        return execute(sql, params, many, context)
+
+    def _get_stats(self, name):
+        if name not in self.phases:
+            self.phases[name] = {'seconds': 0.0, 'queries': 0, 'calls': 0}
+        return self.phases[name]
+
+
+class NullPhaseTimer(object):
+
+    @contextmanager
+    def phase(self, name):
+        yield
+
+
+NULL_TIMER = NullPhaseTimer()
@@ -1,39 +1,66 @@
+import datetime
 import time
 
-import pytz
-import portalocker
 from rest_framework import viewsets, status
 from rest_framework.filters import OrderingFilter, SearchFilter
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
 from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.db import transaction
 from rest_framework.response import Response
 import django_filters.rest_framework
 from django.core.exceptions import FieldError
-from django.db.models import Max, Count, F, Q
-from rest_framework.decorators import action
+from django.db.models import Max, Count, ExpressionWrapper, F, IntegerField, Q, Sum, Value
+from django.db.models.functions import Floor
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import LimitOffsetPagination
+from . import activity
+from . import caching
+from . import heatmap
+from . import leaderboards
+from . import pagination
+from . import ingest
 from . import models
 from . import serializers
-import numpy as np
+from . import stats
+from . import tasks
+from . import words
 import json
-from json.decoder import JSONDecodeError
-import binascii
 import os
-from dateutil import parser
-from dateutil.utils import default_tzinfo
-from .exceptions import MissingParametersException
-import semver
+from .exceptions import MissingParametersException, DuplicateLogException, UnsupportedLogVersionException
+from .logreader import log_crc
+from .search import SEARCH_MODES, search_text_messages
+
+
+class PlayerSearchFilter(SearchFilter):
+    """
+    Finds players by the start of their name, or by their id if that's what was typed in, so that the lookup can go
+    through an index.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search = ' '.join(self.get_search_terms(request))
+        if search == '':
+            return queryset
+        condition = Q(name__istartswith=search)
+        if search.isdigit() and len(search) <= 18:
+            condition |= Q(id=int(search))
+        return queryset.filter(condition)
 
 
 class PlayerViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = models.Player.objects.all()
+    queryset = models.Player.objects.prefetch_related('names')
     serializer_class = serializers.PlayerSerializer
-    search_fields = ['id', 'names__name']
-    filter_backends = (SearchFilter, OrderingFilter,)
+    filter_backends = (PlayerSearchFilter, OrderingFilter,)
     ordering_fields = ['kills', 'deaths', 'ff_kills', 'playtime']
 
     @action(detail=False)
+    @caching.cached_response('players-damage-type-kills', lambda request: [
+        ('player', request.GET['killer_id']) if 'killer_id' in request.GET else caching.ALL_LOGS
+    ])
     def damage_type_kills(self, request):
         killer_id = request.query_params.get('killer_id', None)
         frags = models.Frag.objects.all()
@@ -46,6 +73,7 @@ class PlayerViewSet(viewsets.ReadOnlyModelViewSet):
         return paginator.get_paginated_response(data)
 
     @action(detail=True)
+    @caching.conditional_response(lambda request, pk: caching.get_version([('player', pk)]))
     def stats(self, request, pk):
         player = models.Player.objects.get(id=pk)
         kd_ratio = player.kills / player.deaths if player.deaths != 0 else 0.0
@@ -65,35 +93,32 @@ class PlayerViewSet(viewsets.ReadOnlyModelViewSet):
 
     @action(detail=True)
     def sessions(self, request, pk):
-        # TODO: different types of sessions (per day)
-        player = models.Player.objects.get(id=pk)
-        dates = dict()
-        for session in player.sessions.all():
-            date = str(session.started_at.date())
-            if date not in dates:
-                dates[date] = session.duration
-            else:
-                dates[date] += session.duration
+        granularity = request.query_params.get('granularity', 'day')
+        if granularity not in activity.GRANULARITIES:
+            raise ValidationError('granularity must be one of {}.'.format(', '.join(activity.GRANULARITIES)))
+        periods = activity.get_activity(pk, granularity, started_after=get_date_param(request, 'started_after'),
+                                        started_before=get_date_param(request, 'started_before'))
         return JsonResponse({
-            'results': dates
+            'results': {str(date): playtime for date, playtime, session_count in periods},
+            'session_counts': {str(date): session_count for date, playtime, session_count in periods}
         })
 
     @action(detail=False)
+    @caching.cached_response('players-most-kills')
     def most_kills(self, request):
-        data = models.Frag.objects.values('killer').annotate(count=Count('id')).order_by('-count')
+        # Read off the all-time kills leaderboard rather than counting every frag.
+        entries = leaderboards.get_board(models.LeaderboardEntry.objects.select_related('player'), 'kills', min_kills=1)
         paginator = LimitOffsetPagination()
-        data = paginator.paginate_queryset(data, request)
+        entries = paginator.paginate_queryset(entries, request)
         results = []
-        for datum in data:
-            player = models.Player.objects.get(pk=datum['killer'])
-            result = {
-                'count': datum['count'],
+        for entry in entries:
+            results.append({
+                'count': entry.kills,
                 'player': {
-                    'id': player.id,
-                    'name': player.name
+                    'id': entry.player.id,
+                    'name': entry.player.name or 'Unknown'
                 }
-            }
-            results.append(result)
+            })
         return paginator.get_paginated_response(results)
 
 
@@ -103,9 +128,30 @@ class DamageTypeViewSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ['id']
 
 
+MAX_RANGE_HISTOGRAM_BINS = 1000
+
+
+def get_date_param(request, name):
+    if name not in request.query_params:
+        return None
+    try:
+        value = parse_date(request.query_params[name])
+    except ValueError:
+        value = None
+    if value is None:
+        raise ValidationError('{} must be a date (YYYY-MM-DD).'.format(name))
+    return value
+
+
+def start_of_day(date):
+    return datetime.datetime.combine(date, datetime.time(), tzinfo=timezone.utc)
+
+
 class FragViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = models.Frag.objects.all()
     serializer_class = serializers.FragSerializer
+    pagination_class = pagination.OptionalCursorPagination
+    cursor_ordering = '-id'
 
     def get_queryset(self):
         queryset = models.Frag.objects.all()
@@ -118,34 +164,50 @@ class FragViewSet(viewsets.ReadOnlyModelViewSet):
         return queryset
 
     @action(detail=False)
-    # TODO: this is massively inefficient, use aggregation/rounding to speed this up!
+    @caching.cached_response('frags-range-histogram')
     def range_histogram(self, request):
         damage_type_ids = request.query_params.getlist('damage_type_ids[]', None)
         if damage_type_ids is None:
             raise MissingParametersException(['damage_type_id'])
-        bin_size_in_meters = 5
+        try:
+            damage_type_ids = sorted(set(int(x) for x in damage_type_ids))
+            bin_size_in_meters = float(request.query_params.get('bin_size', 5))
+            bin_count = int(request.query_params.get('bin_count', 25))
+        except ValueError:
+            raise ValidationError('damage_type_ids[], bin_size and bin_count must be numbers.')
+        if bin_size_in_meters.is_integer():
+            bin_size_in_meters = int(bin_size_in_meters)
+        if bin_size_in_meters <= 0 or not 0 < bin_count <= MAX_RANGE_HISTOGRAM_BINS:
+            raise ValidationError('bin_size must be positive and bin_count between 1 and {}.'.format(MAX_RANGE_HISTOGRAM_BINS))
+        started_after = get_date_param(request, 'started_after')
+        started_before = get_date_param(request, 'started_before')
+
         bin_size = bin_size_in_meters * 60.352
+        frags = models.Frag.objects.filter(damage_type_id__in=damage_type_ids, distance__lt=bin_count * bin_size)
+        if started_after is not None:
+            frags = frags.filter(round__started_at__gte=start_of_day(started_after))
+        if started_before is not None:
+            frags = frags.filter(round__started_at__lt=start_of_day(started_before + datetime.timedelta(days=1)))
+        # Count every damage type's frags into bins in one go.
+        counts = frags.annotate(bin=Floor(F('distance') / Value(bin_size)))\
+            .values_list('damage_type_id', 'bin').annotate(count=Count('id')).order_by()
         data = {}
         for damage_type_id in damage_type_ids:
-            bins = []
-            frags = models.Frag.objects.filter(damage_type__id=damage_type_id)
-            total = 0
-            for i in range(25):
-                min_distance = int(i * bin_size)
-                max_distance = (i + 1) * bin_size
-                count = frags.filter(damage_type__id=damage_type_id, distance__gte=min_distance, distance__lt=max_distance).count()
-                total += count
-                bins.append([i * bin_size_in_meters, count])
-            data[damage_type_id] = {
-                'total': total,
-                'bins': bins
+            data[str(damage_type_id)] = {
+                'total': 0,
+                'bins': [[i * bin_size_in_meters, 0] for i in range(bin_count)]
             }
+        for damage_type_id, i, count in counts:
+            data[str(damage_type_id)]['total'] += count
+            data[str(damage_type_id)]['bins'][int(i)][1] += count
         return JsonResponse(data)
 
 
 class VehicleFragViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = models.VehicleFrag.objects.all()
+    queryset = models.VehicleFrag.objects.select_related('killer_pawn_class', 'killer_vehicle_class', 'vehicle_class')
     serializer_class = serializers.VehicleFragSerializer
+    pagination_class = pagination.OptionalCursorPagination
+    cursor_ordering = '-id'
 
 
 class EventViewSet(viewsets.ReadOnlyModelViewSet):
@@ -153,32 +215,80 @@ class EventViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = serializers.EventSerializer
 
 
+def parse_week(value):
+    date = parse_date(value)
+    return heatmap.get_week(date) if date is not None else None
+
+
 class MapViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = models.Map.objects.order_by('name')
     serializer_class = serializers.MapSerializer
     search_fields = ['name']
 
     @action(detail=True)
+    @caching.conditional_response(lambda request, pk: caching.get_version([('map', pk)]))
+    @caching.cached_response('maps-summary', lambda request, pk: [('map', pk)])
     def summary(self, request, pk):
-        rounds = models.Round.objects.filter(log__map_id=pk)
-        round_count = rounds.count()
-        axis_wins = rounds.filter(winner=0).count()
-        allied_wins = rounds.filter(winner=1).count()
-        axis_deaths = models.Frag.objects.filter(round__log__map_id=pk, victim_team_index=0).count()
-        allied_deaths = models.Frag.objects.filter(round__log__map_id=pk, victim_team_index=1).count()
+        data = models.Round.objects.filter(log__map_id=pk).aggregate(
+            round_count=Count('id'),
+            axis_wins=Count('id', filter=Q(winner=0)),
+            allied_wins=Count('id', filter=Q(winner=1)),
+            axis_deaths=Sum('summary__axis_deaths'),
+            allied_deaths=Sum('summary__allied_deaths')
+        )
         return JsonResponse({
-            'round_count': round_count,
-            'axis_wins': axis_wins,
-            'allied_wins': allied_wins,
-            'axis_deaths': axis_deaths,
-            'allied_deaths': allied_deaths
+            'round_count': data['round_count'],
+            'axis_wins': data['axis_wins'],
+            'allied_wins': data['allied_wins'],
+            'axis_deaths': data['axis_deaths'] or 0,
+            'allied_deaths': data['allied_deaths'] or 0
         })
 
     @action(detail=True)
+    @caching.cached_response('maps-heatmap', lambda request, pk: [('map', pk)])
     def heatmap(self, request, pk):
-        frags = models.Frag.objects.filter(round__log__map_id=pk)
-        data = list(map(lambda x: x.victim_location, frags.all()))
+        map = self.get_object()
+        bounds = heatmap.get_bounds(map)
+        if bounds is None:
+            return JsonResponse({'zoom': None, 'cell_size': None, 'data': []})
+        try:
+            if 'cell_size' in request.query_params:
+                zoom = heatmap.get_zoom_for_cell_size(bounds, float(request.query_params['cell_size']))
+            else:
+                zoom = int(request.query_params.get('zoom', heatmap.DEFAULT_ZOOM))
+        except ValueError:
+            raise ValidationError('zoom and cell_size must be numbers.')
+        if zoom not in heatmap.ZOOM_LEVELS:
+            raise ValidationError('zoom must be one of {}.'.format(', '.join(str(x) for x in heatmap.ZOOM_LEVELS)))
+        cells = models.HeatmapCell.objects.filter(map=map)
+        # Cells are counted by the week, so dates are widened out to the weeks they're in.
+        filters = (
+            ('team', 'team_index', int),
+            ('damage_type_id', 'damage_type_id', int),
+            ('started_after', 'week__gte', parse_week),
+            ('started_before', 'week__lte', parse_week)
+        )
+        for param, lookup, parse in filters:
+            if param in request.query_params:
+                try:
+                    value = parse(request.query_params[param])
+                except ValueError:
+                    value = None
+                if value is None:
+                    raise ValidationError('Invalid {}.'.format(param))
+                cells = cells.filter(**{lookup: value})
+        # Each cell at this zoom level covers a square of cells at the finest level, which are stored.
+        scale = 2 ** (heatmap.MAX_ZOOM - zoom)
+        cells = cells.annotate(
+            cell_x=ExpressionWrapper(F('x') / Value(scale), output_field=IntegerField()),
+            cell_y=ExpressionWrapper(F('y') / Value(scale), output_field=IntegerField())
+        ).values_list('cell_x', 'cell_y').annotate(total=Sum('count')).order_by()
+        # Each cell is reported as the location of its centre and the number of frags in it.
+        cell_width, cell_height = heatmap.get_cell_size(bounds, zoom)
+        data = [[bounds[0] + (x + 0.5) * cell_width, bounds[1] + (y + 0.5) * cell_height, count] for x, y, count in cells]
         return JsonResponse({
+            'zoom': zoom,
+            'cell_size': [cell_width, cell_height],
             'data': data
         })
 
@@ -186,335 +296,122 @@ class MapViewSet(viewsets.ReadOnlyModelViewSet):
 class TextMessageFilterSet(django_filters.rest_framework.FilterSet):
     message = django_filters.rest_framework.CharFilter(field_name='message', lookup_expr='icontains')
     map = django_filters.rest_framework.CharFilter(field_name='log__map', lookup_expr='exact')
+    search = django_filters.rest_framework.CharFilter(method='filter_search')
+    search_mode = django_filters.rest_framework.ChoiceFilter(choices=[(x, x) for x in SEARCH_MODES],
+                                                             method='filter_search_mode')
 
     class Meta:
         model = models.TextMessage
         fields = ('log', 'sender', 'message', 'type', 'map', 'team_index')
 
+    def filter_search(self, queryset, name, value):
+        return search_text_messages(queryset, value, self.form.cleaned_data.get('search_mode') or 'plain')
+
+    def filter_search_mode(self, queryset, name, value):
+        # Used by `filter_search`.
+        return queryset
+
+
+class WordCountFilterSet(django_filters.rest_framework.FilterSet):
+
+    class Meta:
+        model = models.WordCount
+        fields = ('log', 'map', 'type', 'team_index')
+
 
 class TextMessageViewset(viewsets.ReadOnlyModelViewSet):
     queryset = models.TextMessage.objects.all()
     serializer_class = serializers.TextMessageSerializer
     filter_backends = (django_filters.rest_framework.DjangoFilterBackend,)
     filterset_class = TextMessageFilterSet
+    pagination_class = pagination.OptionalCursorPagination
+    cursor_ordering = '-sent_at'
 
     @action(detail=False)
+    @caching.cached_response('text-messages-words')
     def words(self, request):
-        # TODO: reverse-lookup
-        word_counts = dict()
-        text_message_filter = TextMessageFilterSet(request.GET, queryset=self.queryset)
-        for text_message in text_message_filter.qs:
-            words = text_message.message.replace('.', ' ').replace(',', ' ').lower().split()
-            # TODO: remove punctuation marks
-            for word in words:
-                if word not in word_counts:
-                    word_counts[word] = 0
-                word_counts[word] += 1
-        # TODO: import this from a file, maybe
-        excludes = ['', 'a', 'an', 'the', 'and', 'but', 'for', 'nor', 'or', 'so', 'yet', 'then', 'i', 'at', 'to', 'is', 'on', 'this', 'are', 'it', 'of', 'can', 'they', 'that', 'where', 'here', 'in', 'be', 'no', 'yes', 'our', 'has', 'it\'s', 'what', 'us', 'im', 'get', 'do', 'dont', 'with', 'have', 'from', 'was', 'by', 'just', 'there', 'your']
-        for exclude in excludes:
-            try:
-                del word_counts[exclude]
-            except KeyError:
-                pass
-        word_counts = [{'text': k, 'value': v} for (k, v) in word_counts.items()]
-        word_counts.sort(key=lambda x: x['value'], reverse=True)
-        return JsonResponse({'data': word_counts[:50]})
+        stop_words = settings.WORD_CLOUD_STOP_WORDS
+        if request.GET.get('message') or request.GET.get('search') or request.GET.get('sender'):
+            # The word counts aren't broken down by sender or message, so count these up from the messages themselves.
+            word_counts = dict()
+            text_message_filter = TextMessageFilterSet(request.GET, queryset=self.queryset)
+            for message in text_message_filter.qs.values_list('message', flat=True).iterator():
+                for word in words.get_words(message):
+                    if word not in word_counts:
+                        word_counts[word] = 0
+                    word_counts[word] += 1
+            for stop_word in stop_words:
+                word_counts.pop(stop_word, None)
+            word_counts = [{'text': k, 'value': v} for (k, v) in word_counts.items()]
+            # Ties are broken the same way as when they're read from the word counts.
+            word_counts.sort(key=lambda x: (-x['value'], x['text']))
+            return JsonResponse({'data': word_counts[:50]})
+        word_count_filter = WordCountFilterSet(request.GET, queryset=models.WordCount.objects.all())
+        word_counts = word_count_filter.qs.exclude(word__in=stop_words).values('word')\
+            .annotate(total=Sum('count')).order_by('-total', 'word')[:50]
+        return JsonResponse({'data': [{'text': x['word'], 'value': x['total']} for x in word_counts]})
 
     @action(detail=False)
+    @caching.cached_response('text-messages-summary')
     def summary(self, request):
         text_message_filter = TextMessageFilterSet(request.GET, queryset=self.queryset)
         axis_messages = text_message_filter.qs.filter(team_index=0)
         allies_message = text_message_filter.qs.filter(team_index=1)
-        axis_types = {x['type']: x['count'] for x in axis_messages.values('type').annotate(count=Count('type'))}
-        allies_types = {x['type']: x['count'] for x in allies_message.values('type').annotate(count=Count('type'))}
+        axis_types = {x['type']: x['count'] for x in axis_messages.values('type').annotate(count=Count('type')).order_by()}
+        allies_types = {x['type']: x['count'] for x in allies_message.values('type').annotate(count=Count('type')).order_by()}
         data = {'axis': {'total': axis_messages.count(), 'types': axis_types},
                 'allies': {'total': allies_message.count(), 'types': allies_types}}
         return JsonResponse(data)
 
 
-def parse_dt(timestr: str):
-    return default_tzinfo(parser.parse(timestr), pytz.UTC)
-
-
 class LogViewSet(viewsets.ModelViewSet):
     queryset = models.Log.objects.all()
     serializer_class = serializers.LogSerializer
 
+    def perform_destroy(self, instance):
+        instance.delete()
+        caching.invalidate_all()
+
     def create(self, request, *args, **kwargs):
         secret = request.data['secret']
         if secret != os.environ['API_SECRET']:
             raise PermissionDenied('Invalid secret.')
-        data = request.data['log'].file.read()
-        data = data.replace(b'\r', b'')
-        data = data.replace(b'\n', b'')
-        crc = binascii.crc32(data)
-
-        # The game mangles names with special characters which can cause decoding errors.
-        # To mitigate this, let's just replace un-mappable characters with spaces as we
-        # encounter them and hope for the best.
-        attempts = 0
-        while True:
-            try:
-                data = data.decode('cp1251')
-            except UnicodeDecodeError as e:
-                attempts += 1
-                if attempts >= 100:
-                    raise RuntimeError('Failed to resolve string decoding errors via brute force, giving up!')
-                data = bytearray(data)
-                data[e.start:e.end] = b' '
-                continue
-            break
+        file = request.data['log'].file
+        crc = log_crc(file)
+
+        if settings.ASYNC_LOG_INGEST:
+            # Defer the heavy lifting to a worker; all we do here is make sure we haven't seen the log before. Jobs
+            # abandoned by a worker that died don't count.
+            jobs = models.LogJob.objects.filter(crc=crc).exclude(status='failed')\
+                .exclude(status__in=('parsing', 'ingesting'), started_at__lt=ingest.get_stale_log_job_started_at())
+            if models.Log.objects.filter(crc=crc).exists() or jobs.exists():
+                return Response(None, status=status.HTTP_409_CONFLICT, headers={})
+            with transaction.atomic():
+                job = models.LogJob.objects.create(crc=crc)
+                ingest.store_log_job_payload(job, file)
+            if settings.BROKER_URL:
+                transaction.on_commit(lambda: tasks.ingest_log_job.delay(job.id))
+            data = serializers.LogJobSerializer(instance=job).data
+            return Response(data, status=status.HTTP_202_ACCEPTED, headers={})
 
         try:
-            data = json.loads(data)
-        except JSONDecodeError:
-            # Versions <=v9.0.9 had a bug where backslashes and double-quotes were not being properly escaped
-            # and therefore couldn't be parsed properly. If we run into a decoding error, attempt to escape the
-            # backslashes and load it up again.
-            data = data.replace('\\', '\\\\')
-            data = json.loads(data)
-
-        # aggregate lists from the data (do this before we do DB-heavy stuff)
-        unique_damage_types = self.get_unique_damage_types(data)
-        unique_pawn_classes = self.get_unique_pawn_clases(data)
-        unique_construction_classes = self.get_unique_construction_classes(data)
-
-        # ensure that this log hasn't been evaluated before
-        try:
-            models.Log.objects.get(crc=crc)
+            ingest.ingest_log_file(file, crc)
+        except DuplicateLogException:
             return Response(None, status=status.HTTP_409_CONFLICT, headers={})
-        except ObjectDoesNotExist:
-            pass
-
-        # version gate
-        if semver.compare(data['version'][1:], '8.3.0') < 0:
-            data = {'success': False, 'error': 'Log file version {} is unsupported.'.format(data['version'][1:])}
+        except UnsupportedLogVersionException as e:
+            data = {'success': False, 'error': e.error_message}
             return JsonResponse(data, status=status.HTTP_406_NOT_ACCEPTABLE)
 
-        # use file locking scheme to avoid database deadlocks (find a better solution in future!)
-
-        with portalocker.Lock('./db.lock', timeout=30, fail_when_locked=False) as lock:
-            with transaction.atomic():
-                log = models.Log()
-                log.crc = crc
-                log.version = data['version']
-
-                map_data = data['map']
-                log.map = models.Map.objects.get_or_create(name=map_data['name'])[0]
-                log.map.bounds_ne_x = map_data['bounds']['ne'][0]
-                log.map.bounds_ne_y = map_data['bounds']['ne'][1]
-                log.map.bounds_sw_x = map_data['bounds']['sw'][0]
-                log.map.bounds_sw_y = map_data['bounds']['sw'][1]
-                log.map.offset = map_data['offset']
-                log.map.save()
-                log.save()
-
-                players_by_id = dict()
-
-                for player_data in data['players']:
-                    player_id = int(player_data['id'])
-                    try:
-                        player = models.Player.objects.get(id=player_id)
-                    except ObjectDoesNotExist:
-                        player = models.Player(id=player_id)
-                        player.save()
-                    for session_data in player_data['sessions']:
-                        session = models.Session()
-                        session.ip = session_data['ip']
-                        session.started_at = parse_dt(session_data['started_at'])
-                        if semver.compare(data['version'][1:], '9.0.9') <= 0:
-                            if session_data['ended_at'] == '':
-                                # There was a bug with <=v9.0.9 where player timeouts would not terminate sessions,
-                                # resulting in ended_at being an empty string. This fix effectively terminates the session
-                                # immediately.
-                                session.ended_at = parse_dt(session_data['started_at'])
-                            else:
-                                session.ended_at = parse_dt(session_data['ended_at'])
-                        else:
-                            session.ended_at = parse_dt(session_data['ended_at'])
-                        session.save()
-                        player.sessions.add(session)
-                    for name in player_data['names']:
-                        if name not in map(lambda x: x.name, player.names.all()):
-                            player_name = models.PlayerName(name=name)
-                            player_name.save()
-                            player.names.add(player_name)
-                    log.players.add(player)
-                    players_by_id[player_id] = player
-                    player.save()
-
-                # text messages
-                admin_player_id = "20b300195d48c2ccc2651885cfea1a2f"
-                models.TextMessage.objects.bulk_create(
-                    map(lambda text_message: models.TextMessage(
-                        log=log,
-                        type=text_message['type'],
-                        message=text_message['message'][:128],
-                        sender=players_by_id[int(text_message['sender'])],
-                        sent_at=parse_dt(text_message['sent_at']),
-                        team_index=text_message['team_index'],
-                        squad_index=text_message['squad_index']
-                    ), filter(lambda x: x['sender'] != admin_player_id, data['text_messages']))
-                )
-
-                # damage types
-                damage_types_by_id = {None: None}
-                for classname in unique_damage_types:
-                    damage_types_by_id[classname] = models.DamageTypeClass.objects.get_or_create(classname=classname)[0]
-
-                # pawn classes
-                pawn_classes_by_id = {None: None}
-                for classname in unique_pawn_classes:
-                    pawn_classes_by_id[classname] = models.PawnClass.objects.get_or_create(classname=classname)[0]
-
-                # rounds
-                for round_data in data['rounds']:
-                    round = models.Round()
-                    round.started_at = parse_dt(round_data['started_at'])
-                    round.ended_at = None if round_data['ended_at'] is None else parse_dt(round_data['ended_at'])
-                    round.winner = round_data['winner']
-                    round.log = log
-                    round.save()
-
-                    # 2.6s the time to beat on 2021-03-06T22_50_23.log
-
-                    models.Frag.objects.bulk_create(
-                        map(lambda frag_data: models.Frag(
-                            damage_type=damage_types_by_id[frag_data['damage_type']],
-                            hit_index=frag_data['hit_index'],
-                            time=frag_data['time'],
-                            killer=players_by_id[int(frag_data['killer']['id'])],
-                            killer_team_index=frag_data['killer']['team'],
-                            killer_location_x=frag_data['killer']['location'][0],
-                            killer_location_y=frag_data['killer']['location'][1],
-                            killer_location_z=frag_data['killer']['location'][2],
-                            killer_pawn_class=pawn_classes_by_id[frag_data['killer']['pawn']],
-                            killer_vehicle=pawn_classes_by_id[frag_data['killer']['vehicle']],
-                            victim=players_by_id[int(frag_data['victim']['id'])],
-                            victim_team_index=frag_data['victim']['team'],
-                            victim_location_x=frag_data['victim']['location'][0],
-                            victim_location_y=frag_data['victim']['location'][1],
-                            victim_location_z=frag_data['victim']['location'][2],
-                            victim_pawn_class=pawn_classes_by_id[frag_data['victim']['pawn']],
-                            distance=np.linalg.norm(np.subtract(frag_data['victim']['location'], frag_data['killer']['location'])),
-                            round=round,
-                        ), round_data['frags'])
-                    )
-
-                    models.VehicleFrag.objects.bulk_create(
-                        map(lambda vehicle_frag_data: models.VehicleFrag(
-                            round=round,
-                            time=vehicle_frag_data['time'],
-                            damage_type=damage_types_by_id[vehicle_frag_data['damage_type']],
-                            killer=players_by_id[int(vehicle_frag_data['killer']['id'])],
-                            killer_team_index=vehicle_frag_data['killer']['team'],
-                            killer_location_x=vehicle_frag_data['killer']['location'][0],
-                            killer_location_y=vehicle_frag_data['killer']['location'][1],
-                            killer_location_z=vehicle_frag_data['killer']['location'][2],
-                            killer_pawn_class=pawn_classes_by_id[vehicle_frag_data['killer']['pawn']],
-                            killer_vehicle_class=pawn_classes_by_id[vehicle_frag_data['killer']['vehicle']],
-                            vehicle_class=pawn_classes_by_id[vehicle_frag_data['destroyed_vehicle']['vehicle']],
-                            vehicle_team_index=vehicle_frag_data['destroyed_vehicle']['team'],
-                            vehicle_location_x=vehicle_frag_data['destroyed_vehicle']['location'][0],
-                            vehicle_location_y=vehicle_frag_data['destroyed_vehicle']['location'][1],
-                            vehicle_location_z=vehicle_frag_data['destroyed_vehicle']['location'][2],
-                            distance=np.linalg.norm(np.subtract(vehicle_frag_data['destroyed_vehicle']['location'], vehicle_frag_data['killer']['location'])),
-                        ), round_data['vehicle_frags'])
-                    )
-
-                    # rally points
-                    models.RallyPoint.objects.bulk_create(
-                        map(lambda rally_point: models.RallyPoint(
-                            team_index=rally_point['team_index'],
-                            squad_index=rally_point['squad_index'],
-                            player=players_by_id[int(rally_point['player_id'])],
-                            is_established=rally_point['is_established'],
-                            establisher_count=rally_point['establisher_count'],
-                            location_x=rally_point['location'][0],
-                            location_y=rally_point['location'][1],
-                            location_z=rally_point['location'][2],
-                            created_at=parse_dt(rally_point['created_at']),
-                            destroyed_at=None if rally_point['destroyed_at'] is None else parse_dt(rally_point['destroyed_at']),
-                            destroyed_reason=rally_point['destroyed_reason'],
-                            spawn_count=rally_point['spawn_count'],
-                            round=round
-                        ), round_data['rally_points'])
-                    )
-
-                    # constructions
-                    construction_classes_by_class = {None: None}
-                    for construction_class in unique_construction_classes:
-                        construction_classes_by_class[construction_class] = models.ConstructionClass.objects.get_or_create(classname=construction_class)[0]
-
-                    models.Construction.objects.bulk_create(
-                        map(lambda construction_data: models.Construction(
-                            classname=construction_classes_by_class[construction_data['class']],
-                            player=players_by_id[int(construction_data['player_id'])],
-                            team_index=construction_data['team'],
-                            round_time=construction_data['round_time'],
-                            location_x=construction_data['location'][0],
-                            location_y=construction_data['location'][1],
-                            location_z=construction_data['location'][2],
-                            round=round
-                        ), round_data['constructions'])
-                    )
-
-                    if 'events' in round_data:
-                        models.Event.objects.bulk_create(
-                            map(lambda event_data: models.Event(
-                                type=event_data['type'],
-                                data=json.dumps(event_data['data']),
-                                round=round
-                            ), round_data['events'])
-                        )
-
-                log.save()
-
-                # Recalculate all aggregate stats for players involved in the game.
-                for player in log.players.all():
-                    player.calculate_stats()
-
-        # TODO: store the log on disk, gzip'd probably
-        log_path = os.path.join('storage', 'logs', str(crc) + '.log')
-        os.makedirs(os.path.dirname(log_path), exist_ok=True)
-        json.dump(data, open(log_path, 'w'))
-
         return Response({}, status=status.HTTP_201_CREATED, headers={})
 
-    def get_unique_damage_types(self, data):
-        unique_damage_types = set()
-        for round_data in data['rounds']:
-            for frag_data in round_data['frags']:
-                unique_damage_types.add(frag_data['damage_type'])
-            for frag_data in round_data['vehicle_frags']:
-                unique_damage_types.add(frag_data['damage_type'])
-        return unique_damage_types
-
-    def get_unique_pawn_clases(self, data):
-        unique_pawn_classes = set()
-        for round_data in data['rounds']:
-            for frag_data in round_data['frags']:
-                if frag_data['killer']['pawn'] is not None:
-                    unique_pawn_classes.add(frag_data['killer']['pawn'])
-                if frag_data['killer']['vehicle'] is not None:
-                    unique_pawn_classes.add(frag_data['killer']['vehicle'])
-                if frag_data['victim']['pawn'] is not None:
-                    unique_pawn_classes.add(frag_data['victim']['pawn'])
-            for vehicle_frag_data in round_data['vehicle_frags']:
-                unique_pawn_classes.add(vehicle_frag_data['destroyed_vehicle']['vehicle'])
-                if vehicle_frag_data['killer']['pawn'] is not None:
-                    unique_pawn_classes.add(vehicle_frag_data['killer']['pawn'])
-                if vehicle_frag_data['killer']['vehicle'] is not None:
-                    unique_pawn_classes.add(vehicle_frag_data['killer']['vehicle'])
-        return unique_pawn_classes
-
-    def get_unique_construction_classes(self, data):
-        unique_construction_classes = set()
-        for round_data in data['rounds']:
-            for construction_data in round_data['constructions']:
-                unique_construction_classes.add(construction_data['class'])
-        return unique_construction_classes
+    @action(detail=False, url_path=r'jobs/(?P<job_id>[0-9]+)')
+    def job(self, request, job_id):
+        try:
+            job = models.LogJob.objects.get(pk=job_id)
+        except ObjectDoesNotExist:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        data = serializers.LogJobSerializer(instance=job).data
+        return Response(data)
 
 
 class RoundFilterSet(django_filters.rest_framework.FilterSet):
@@ -536,11 +433,21 @@ class PatronViewSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ['player__id']
 
 
+def get_announcement_version():
+    # Announcements are edited in the admin rather than ingested, so the latest one is its own version.
+    announcement = models.Announcement.objects.filter(is_published=True).order_by('-created_at')\
+        .values('id', 'created_at', 'title', 'url', 'content').first()
+    if announcement is None:
+        return None, None
+    return sorted(announcement.items()), announcement['created_at']
+
+
 class AnnouncementViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = models.Announcement.objects.all()
     serializer_class = serializers.AnnouncementSerializer
 
     @action(detail=False)
+    @caching.conditional_response(lambda request: get_announcement_version())
     def latest(self, request):
         queryset = models.Announcement.objects.filter(is_published=True).order_by('-created_at')
         if queryset.count() == 0:
@@ -550,49 +457,114 @@ class AnnouncementViewSet(viewsets.ReadOnlyModelViewSet):
         return JsonResponse(data)
 
 
+class LeaderboardViewSet(viewsets.GenericViewSet):
+    """
+    Players ranked by `stat` (one of `leaderboards.STATS`) over all time, on the map `map_id`, or in the week of the
+    date `week`.
+    """
+    queryset = models.LeaderboardEntry.objects.select_related('player')
+    serializer_class = serializers.LeaderboardEntrySerializer
+
+    def get_board(self, request):
+        stat = request.query_params.get('stat', 'kills')
+        if stat not in leaderboards.STATS:
+            raise ValidationError('stat must be one of {}.'.format(', '.join(leaderboards.STATS)))
+        map_id = request.query_params.get('map_id', None)
+        if map_id is not None and not map_id.isdigit():
+            raise ValidationError('map_id must be a number.')
+        week = get_date_param(request, 'week')
+        if map_id is not None and week is not None:
+            raise ValidationError('Leaderboards are kept per map or per week, not both.')
+        min_kills = request.query_params.get('min_kills', '0')
+        if not min_kills.isdigit():
+            raise ValidationError('min_kills must be a number.')
+        board = leaderboards.get_board(self.get_queryset(), stat, map_id=map_id,
+                                       week=leaderboards.get_week(week) if week is not None else None,
+                                       min_kills=int(min_kills))
+        return stat, board
+
+    def list(self, request):
+        stat, board = self.get_board(request)
+        entries = self.paginate_queryset(board)
+        leaderboards.rank_entries(board, stat, entries, self.paginator.offset)
+        return self.get_paginated_response(self.get_serializer(entries, many=True).data)
+
+    @action(detail=False)
+    def rank(self, request):
+        stat, board = self.get_board(request)
+        player_id = request.query_params.get('player_id', None)
+        if player_id is None or not player_id.isdigit():
+            raise ValidationError('player_id must be a number.')
+        entry = board.filter(player_id=player_id).first()
+        if entry is None:
+            raise NotFound('Player {} is not on this leaderboard.'.format(player_id))
+        entry.rank = leaderboards.get_rank(board, stat, entry)
+        return Response(self.get_serializer(entry).data)
+
+
+SCOREBOARD_ORDERING_FIELDS = ('kills', 'deaths', 'kd', 'tks')
+
+
 class RoundViewSet(viewsets.ReadOnlyModelViewSet):
     model = models.Round
-    queryset = models.Round.objects.all().order_by('-started_at')
+    queryset = models.Round.objects.select_related('log__map', 'summary').order_by('-started_at')
     serializer_class = serializers.RoundSerializer
     filter_backends = (django_filters.rest_framework.DjangoFilterBackend,)
     filterset_class = RoundFilterSet
+    pagination_class = pagination.OptionalCursorPagination
+    cursor_ordering = '-started_at'
+
+    @caching.conditional_response(lambda request: caching.get_version([caching.ALL_LOGS]))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
     @action(detail=True)
+    @caching.cached_response('rounds-summary', lambda request, pk: [('round', pk)])
     def summary(self, request, pk):
-        round = models.Round.objects.get(pk=pk)
-        deaths = models.Frag.objects.filter(round=round).count()
-        axis_deaths = models.Frag.objects.filter(round=round, victim_team_index=0).count()
-        allied_deaths = models.Frag.objects.filter(round=round, victim_team_index=1).count()
+        try:
+            summary = models.RoundSummary.objects.get(round_id=pk)
+        except ObjectDoesNotExist:
+            # Rounds from before summaries were recorded, until `rebuild_round_summaries` has been run.
+            summary = stats.calculate_round_summaries([models.Round.objects.get(pk=pk).id])[0]
         data = {
-            'kills': deaths,
-            'axis_deaths': axis_deaths,
-            'allied_deaths': allied_deaths
+            'kills': summary.kills,
+            'axis_deaths': summary.axis_deaths,
+            'allied_deaths': summary.allied_deaths
         }
         return JsonResponse(data)
 
     @action(detail=True)
     def scoreboard(self, request, pk):
-        # add sorting
         round = models.Round.objects.get(pk=pk)
-        paginator = LimitOffsetPagination()
-        player_ids = list(map(lambda x: x.id, round.log.players.all()))
-        players = models.Player.objects.filter(id__in=player_ids)
-        players = paginator.paginate_queryset(players, request)
+        player_ids = models.Log.players.through.objects.filter(log_id=round.log_id).values_list('player_id', flat=True)
+        scores = {player_id: {'kills': 0, 'deaths': 0, 'tks': 0} for player_id in player_ids}
+        # Tally everyone's kills and deaths from one pass over the round's frags, rather than counting them per player.
+        frags = models.Frag.objects.filter(round=round).values('killer_id', 'victim_id').annotate(
+            count=Count('id'),
+            tks=Count('id', filter=Q(killer_team_index=F('victim_team_index')))
+        ).order_by()
+        for frag in frags:
+            if frag['killer_id'] in scores:
+                scores[frag['killer_id']]['kills'] += frag['count']
+                scores[frag['killer_id']]['tks'] += frag['tks']
+            if frag['victim_id'] in scores:
+                scores[frag['victim_id']]['deaths'] += frag['count']
         data = []
-        for player in players:
-            kills = models.Frag.objects.filter(round=round, killer=player).count()
-            deaths = models.Frag.objects.filter(round=round, victim=player).count()
-            tks = models.Frag.objects.filter(round=round, killer=player, killer_team_index=F('victim_team_index')).count()
-            data.append({
-                'player': {
-                    'id': player.id,
-                    'name': player.names.all()[0].name
-                },
-                'kills': kills,
-                'deaths': deaths,
-                'kd': kills / deaths if deaths > 0 else None,
-                'tks': tks
-            })
+        for player_id, score in scores.items():
+            score['kd'] = score['kills'] / score['deaths'] if score['deaths'] > 0 else None
+            data.append(dict(score, player={'id': player_id}))
+        data.sort(key=lambda x: x['player']['id'])
+        ordering = request.query_params.get('ordering', None)
+        if ordering is not None and ordering.lstrip('-') in SCOREBOARD_ORDERING_FIELDS:
+            field = ordering.lstrip('-')
+            # Players without a K/D (no deaths) go last either way.
+            data = sorted((x for x in data if x[field] is not None), key=lambda x: x[field], reverse=ordering.startswith('-')) + \
+                [x for x in data if x[field] is None]
+        paginator = LimitOffsetPagination()
+        data = paginator.paginate_queryset(data, request)
+        names = dict(models.Player.objects.filter(id__in=[x['player']['id'] for x in data]).values_list('id', 'name'))
+        for datum in data:
+            datum['player']['name'] = names.get(datum['player']['id']) or 'Unknown'
         return paginator.get_paginated_response(data)
 
     @action(detail=True)
@@ -612,7 +584,8 @@ class RoundViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=True)
     def frags(self, request, pk):
         round = models.Round.objects.get(pk=pk)
-        frags = models.Frag.objects.filter(round=round)
+        frags = models.Frag.objects.filter(round=round)\
+            .select_related('killer', 'victim', 'killer_pawn_class', 'victim_pawn_class')
         paginator = LimitOffsetPagination()
         order_by = self.request.query_params.get('order_by', None)
         if order_by is not None:
@@ -631,16 +604,16 @@ class RoundViewSet(viewsets.ReadOnlyModelViewSet):
             frags = frags.filter(victim__id=victim_id)
         frags = paginator.paginate_queryset(frags, request)
         data = list(map(lambda x: {
-            'damage_type_id': x.damage_type.id,
+            'damage_type_id': x.damage_type_id,
             'victim': {
                 'id': x.victim.id,
-                'name': x.victim.names.all()[0].name,
+                'name': x.victim.name or 'Unknown',
                 'pawn': x.victim_pawn_class.classname if x.victim_pawn_class else None,
                 'team': x.victim_team_index
             },
             'killer': {
                 'id': x.killer.id,
-                'name': x.killer.names.all()[0].name,
+                'name': x.killer.name or 'Unknown',
                 'pawn': x.killer_pawn_class.classname if x.killer_pawn_class else None,
                 'team': x.killer_team_index
             },
@@ -653,14 +626,15 @@ class RoundViewSet(viewsets.ReadOnlyModelViewSet):
     def players(self, request, pk):
         round = models.Round.objects.get(pk=pk)
         search = self.request.query_params.get('search', None)
-        print(search)
+        players = round.log.players.prefetch_related('names')
+        if search is not None:
+            players = players.filter(name__icontains=search)
         data = []
-        for player in round.log.players.all():
-            if search is None or search.lower() in player.name.lower():
-                data.append({
-                    'id': player.id,
-                    'names': list(map(lambda x: {'name': x.name}, player.names.all()))
-                })
+        for player in players:
+            data.append({
+                'id': player.id,
+                'names': list(map(lambda x: {'name': x.name}, player.names.all()))
+            })
         return JsonResponse({
             'results': data
         })
@@ -675,43 +649,54 @@ class RallyPointFilterSet(django_filters.rest_framework.FilterSet):
 
 class RallyPointViewSet(viewsets.ReadOnlyModelViewSet):
     model = models.RallyPoint
-    queryset = models.RallyPoint.objects.all()
+    queryset = models.RallyPoint.objects.select_related('player', 'round')
     serializer_class = serializers.RallyPointSerializer
     filter_backends = (django_filters.rest_framework.DjangoFilterBackend,)
     filterset_class = RallyPointFilterSet
+    pagination_class = pagination.OptionalCursorPagination
+    cursor_ordering = '-id'
 
 
+@api_view(['GET'])
+@caching.cached_response('damage-type-friendly-fire')
 def damage_type_friendly_fire(request):
-    damage_types = models.DamageTypeClass.objects.all()
+    summaries = models.DamageTypeSummary.objects.all()
+    map_id = request.query_params.get('map_id', None)
+    if map_id is not None:
+        if not map_id.isdigit():
+            raise ValidationError('map_id must be a number.')
+        summaries = summaries.filter(map_id=map_id)
+    version = request.query_params.get('version', None)
+    if version is not None:
+        summaries = summaries.filter(version=version)
+    started_after = get_date_param(request, 'started_after')
+    if started_after is not None:
+        summaries = summaries.filter(started_at__gte=start_of_day(started_after))
+    started_before = get_date_param(request, 'started_before')
+    if started_before is not None:
+        summaries = summaries.filter(started_at__lt=start_of_day(started_before + datetime.timedelta(days=1)))
+    counts = summaries.values('damage_type_id').annotate(
+        kills=Sum('kills'),
+        team_kills=Sum('team_kills'),
+        suicides=Sum('suicides')
+    ).order_by()
+    counts = {x['damage_type_id']: x for x in counts}
     results = []
-    for damage_type in damage_types:
-        frags = models.Frag.objects.filter(damage_type=damage_type)
-        kills = frags.count()
-        suicides = frags.filter(killer=F('victim')).count()
-        team_kills = frags.filter(~Q(killer=F('victim'))).filter(killer_team_index=F('victim_team_index')).count()
+    for damage_type_id in models.DamageTypeClass.objects.order_by('id').values_list('id', flat=True):
+        count = counts.get(damage_type_id, {'kills': 0, 'team_kills': 0, 'suicides': 0})
         results.append({
-            'id': damage_type.id,
-            'kills': kills,
-            'team_kills': team_kills,
-            'suicides': suicides,
-            'team_kill_ratio': team_kills / kills
+            'id': damage_type_id,
+            'kills': count['kills'],
+            'team_kills': count['team_kills'],
+            'suicides': count['suicides'],
+            'team_kill_ratio': count['team_kills'] / count['kills'] if count['kills'] != 0 else 0.0
         })
-    return JsonResponse({
+    return Response({
         'results': results
     })
 
-import datetime
-
-
-def top_kills_this_week(request):
-    # each round/log that started last week
-    # now minus 7 days
-    started_at = datetime.datetime.now() - datetime.timedelta(days=7)
-    rounds = models.Round.objects.filter(started_at__gte=started_at)
-    # all frags for all rounds
-    frags = models.Frag.objects.filter(round__in=rounds)
-    # TODO: now group by killer
 
+@caching.cached_response('easter')
 def easter(request):
     player_counts = dict()
     for event in models.Event.objects.filter(type='egg_found'):
@@ -0,0 +1,31 @@
+import re
+from collections import Counter
+
+from . import models
+from .db import bulk_insert
+
+# Runs of letters and digits, along with any apostrophes inside them (eg. "don't"). Punctuation is left out.
+WORD_RE = re.compile(r"\w+(?:'\w+)*")
+
+
+def get_words(message):
+    return WORD_RE.findall(message.lower())
+
+
+def get_word_counts(log, text_messages):
+    """
+    Returns unsaved `WordCount`s of the words in `text_messages`, all of which must be from `log`.
+    """
+    counts = Counter()
+    for text_message in text_messages:
+        for word in get_words(text_message.message):
+            counts[(word, text_message.team_index, text_message.type)] += 1
+    return [models.WordCount(log_id=log.id, map_id=log.map_id, word=word, team_index=team_index, type=type, count=count)
+            for (word, team_index, type), count in counts.items()]
+
+
+def rebuild_word_counts(log):
+    models.WordCount.objects.filter(log=log).delete()
+    word_counts = get_word_counts(log, models.TextMessage.objects.filter(log=log).only('message', 'team_index', 'type'))
+    bulk_insert(models.WordCount, word_counts)
+    return len(word_counts)
@@ -137,3 +137,63 @@ CORS_ORIGIN_ALLOW_ALL = True
 CORS_ALLOW_CREDENTIALS = False
 
 ATOMIC_REQUESTS = True
+
+
+# Log ingestion
+# When enabled, uploaded logs are queued as `LogJob`s and ingested by a worker instead of during the request.
+
+ASYNC_LOG_INGEST = os.environ.get('ASYNC_LOG_INGEST', '') == '1'
+
+# When enabled on PostgreSQL, the rows of a log are loaded with COPY rather than INSERTs.
+
+INGEST_USE_COPY = os.environ.get('INGEST_USE_COPY', '') == '1'
+
+# Jobs still being worked on this many seconds after they were started were left behind by a worker that died, and are
+# picked up again.
+
+LOG_JOB_TIMEOUT = int(os.environ.get('LOG_JOB_TIMEOUT', str(60 * 60)))
+
+# Celery is optional; without a broker, queued logs are drained from the database by `manage.py process_log_jobs`.
+
+BROKER_URL = os.environ.get('BROKER_URL')
+CELERY_ACCEPT_CONTENT = ['json']
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_ACKS_LATE = True
+CELERYD_PREFETCH_MULTIPLIER = 1
+
+
+# Reports
+
+# Words left out of word clouds.
+
+WORD_CLOUD_STOP_WORDS = [
+    '', 'a', 'an', 'the', 'and', 'but', 'for', 'nor', 'or', 'so', 'yet', 'then', 'i', 'at', 'to', 'is', 'on', 'this',
+    'are', 'it', 'of', 'can', 'they', 'that', 'where', 'here', 'in', 'be', 'no', 'yes', 'our', 'has', 'it\'s', 'what',
+    'us', 'im', 'get', 'do', 'dont', 'with', 'have', 'from', 'was', 'by', 'just', 'there', 'your'
+]
+
+# Response cache
+# Report responses are cached until a log changes what they'd say (see `api.api.caching`), for at most
+# RESPONSE_CACHE_TIMEOUT seconds, and the least recently used ones are evicted once there are more than
+# RESPONSE_CACHE_MAX_ENTRIES. A local-memory cache is only shared by the threads of one process, so responses are only
+# cached by default once RESPONSE_CACHE_BACKEND and RESPONSE_CACHE_LOCATION point at a cache that every worker shares,
+# such as memcached.
+
+RESPONSE_CACHE = 'responses'
+RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', '1' if 'RESPONSE_CACHE_BACKEND' in os.environ else '0') == '1'
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', str(60 * 60 * 24)))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    RESPONSE_CACHE: {
+        'BACKEND': RESPONSE_CACHE_BACKEND,
+        'LOCATION': os.environ.get('RESPONSE_CACHE_LOCATION', 'responses'),
+        'TIMEOUT': RESPONSE_CACHE_TIMEOUT,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '10000'))
+        } if RESPONSE_CACHE_BACKEND.endswith('LocMemCache') else {}
+    }
+}
@@ -32,6 +32,7 @@ router.register(r'announcements', views.AnnouncementViewSet)
 router.register(r'rally-points', views.RallyPointViewSet)
 router.register(r'text-messages', views.TextMessageViewset)
 router.register(r'vehicle-frags', views.VehicleFragViewSet)
+router.register(r'leaderboards', views.LeaderboardViewSet)
 
 urlpatterns = [
     url(r'^', include(router.urls)),
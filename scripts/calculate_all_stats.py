@@ -1,5 +0,0 @@
-from api.api.models import Player
-
-for player in Player.objects.all():
-    player.calculate_stats()
-    
\ No newline at end of file
@@ -20,5 +20,5 @@ for file in os.listdir(root):
         os.rename(os.path.join(root, file), os.path.join(root, 'corrupt', file))
         continue
     os.makedirs(os.path.join(root, 'processed'), exist_ok=True)
-    if r.status_code in [201, 409]:
+    if r.status_code in [201, 202, 409]:
         os.rename(os.path.join(root, file), os.path.join(root, 'processed', file))